@@ -12,7 +12,8 @@ What it does:
        - Updates all shared raw FoxPro fields from MP_MER.FPB
        - Preserves enrichment columns from the existing CSV for known MERKEYs
        - Adds new MERKEYs (in MP_MER but not yet in CSV) with empty enrichment columns
-  4. Backs up the original MERCH_MASTER.csv before overwriting
+  4. Backs up the original MERCH_MASTER.csv (hard link when possible) and
+     atomically replaces it with the new file
 
 Usage:
     python rebuild_merch_master.py
@@ -80,38 +81,44 @@ class FoxProDBF:
             })
         self.data_start = self.header_length
 
+        # (name, type, decimals, start, end) per field; latin1 is 1 byte per
+        # char so byte offsets double as offsets into the decoded record text
+        self._slots = []
+        offset = 1
+        for f in self.fields:
+            self._slots.append((f["name"], f["type"], f["decimals"], offset, offset + f["length"]))
+            offset += f["length"]
+
     def __iter__(self):
         self.file.seek(self.data_start)
         for _ in range(self.num_records):
             rec = self.file.read(self.record_length)
             if not rec or len(rec) < self.record_length:
                 break
-            if rec[0:1] == b"*":   # deleted
+            if rec[0] == 0x2A:   # deleted ("*")
                 continue
+            rec_text = rec.decode("latin1")   # one decode per record
             row = {}
-            offset = 1
-            for f in self.fields:
-                raw = rec[offset: offset + f["length"]]
-                offset += f["length"]
-                text = raw.decode("latin1", errors="ignore").strip()
-                if f["type"] == "N":
+            for name, ftype, decimals, start, end in self._slots:
+                text = rec_text[start:end].strip()
+                if ftype == "N":
                     if text:
                         try:
-                            row[f["name"]] = float(text) if f["decimals"] > 0 else int(text)
+                            row[name] = float(text) if decimals > 0 else int(text)
                         except ValueError:
-                            row[f["name"]] = None
+                            row[name] = None
                     else:
-                        row[f["name"]] = None
-                elif f["type"] == "D":
+                        row[name] = None
+                elif ftype == "D":
                     if text and len(text) == 8:
                         try:
-                            row[f["name"]] = datetime.strptime(text, "%Y%m%d").strftime("%Y-%m-%d")
+                            row[name] = datetime.strptime(text, "%Y%m%d").strftime("%Y-%m-%d")
                         except ValueError:
-                            row[f["name"]] = ""
+                            row[name] = ""
                     else:
-                        row[f["name"]] = ""
+                        row[name] = ""
                 else:
-                    row[f["name"]] = text
+                    row[name] = text
             yield row
 
     def close(self):
@@ -190,39 +197,58 @@ def rebuild(fpb_path: str, csv_path: str, dry_run: bool = False):
     # Preserve original column order; RECORD# will be renumbered
     out_headers = original_headers[:]  # same columns as original
 
+    # Rows are built as lists in out_headers order so they can go straight to
+    # csv.writer. Column positions are resolved once, not per row.
+    col_index = {h: i for i, h in enumerate(out_headers)}
+    raw_slots = [(field, col_index[field]) for field in FPB_RAW_FIELDS if field in col_index]
+    merkey_idx = col_index.get("MERKEY")
+    record_idx = col_index.get("RECORD#")
+
     output_rows = []
     record_num = 1
 
     for mk, fpb_row in fpb_records.items():
-        # Start from existing row (preserves enrichment) or blank dict
-        base = dict(existing[mk]) if mk in existing else {h: "" for h in out_headers}
+        # Start from existing row (preserves enrichment) or blank row
+        base = list(map(existing[mk].get, out_headers)) if mk in existing else [""] * len(out_headers)
 
         # Update raw FoxPro fields from FPB
-        for field in FPB_RAW_FIELDS:
-            if field in out_headers and field in fpb_row:
+        for field, idx in raw_slots:
+            if field in fpb_row:
                 val = fpb_row[field]
-                base[field] = "" if val is None else str(val)
+                base[idx] = "" if val is None else str(val)
 
         # Always refresh MERKEY from FPB
-        base["MERKEY"] = mk
+        if merkey_idx is not None:
+            base[merkey_idx] = mk
 
         # Renumber RECORD#
-        if "RECORD#" in out_headers:
-            base["RECORD#"] = str(record_num)
+        if record_idx is not None:
+            base[record_idx] = str(record_num)
 
         output_rows.append(base)
         record_num += 1
 
     # --- 5. Backup original ---
+    # Hard-link the backup (O(1), no data copied). The new CSV is written to a
+    # temp file and swapped in with os.replace, which only re-points the name,
+    # so the backup link keeps the original contents. Fall back to a full copy
+    # where hard links aren't supported (e.g. FAT volumes, network shares).
     backup_path = csv_path.replace(".csv", f"_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
-    shutil.copy2(csv_path, backup_path)
+    try:
+        os.link(csv_path, backup_path)
+    except OSError:
+        shutil.copy2(csv_path, backup_path)
     print(f"Backup saved: {backup_path}")
 
-    # --- 6. Write new CSV ---
-    with open(csv_path, "w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=out_headers, extrasaction="ignore")
-        writer.writeheader()
+    # --- 6. Write new CSV (temp file + atomic replace) ---
+    tmp_path = csv_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(out_headers)
         writer.writerows(output_rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, csv_path)
 
     print(f"Written: {csv_path}")
     print(f"  Rows written: {len(output_rows):,}")
@@ -126,6 +126,35 @@ CREATE TABLE IF NOT EXISTS sync_log (
     completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- products_list / dashboard: primary-image join and filter columns
+CREATE INDEX IF NOT EXISTS idx_images_primary ON images(merkey) WHERE is_primary = 1;
+CREATE INDEX IF NOT EXISTS idx_products_filter ON products(active, needs_enrichment, data_quality, merkey);
+
+-- MP_MER sync: current-price lookups and "mark old price" updates
+CREATE INDEX IF NOT EXISTS idx_prices_current_merkey ON prices(merkey) WHERE is_current = 1;
+
+-- products_list search: external-content full-text index over products
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    merkey, description, name, content='products', content_rowid='rowid'
+);
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, merkey, description, name)
+    VALUES (new.rowid, new.merkey, new.description, new.name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, merkey, description, name)
+    VALUES ('delete', old.rowid, old.merkey, old.description, old.name);
+END;
+
+CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF merkey, description, name ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, merkey, description, name)
+    VALUES ('delete', old.rowid, old.merkey, old.description, old.name);
+    INSERT INTO products_fts(rowid, merkey, description, name)
+    VALUES (new.rowid, new.merkey, new.description, new.name);
+END;
+
 CREATE TRIGGER IF NOT EXISTS update_product_timestamp 
 AFTER UPDATE ON products
 FOR EACH ROW
@@ -5,6 +5,8 @@ Anson Supermart Catalog Management
 Syncs prices and product data from FoxPro to SQLite database
 """
 
+import itertools
+import mmap
 import sqlite3
 import struct
 import os
@@ -22,6 +24,17 @@ TEMP_DIR = Path('../Data/Temp')
 # MERET2 = Mode 2 (Pack)
 # MERETP = Mode 3 (Retail/Piece)
 
+# Price rows are queued and written with executemany in batches of this size
+PRICE_BATCH_SIZE = 10000
+
+INSERT_PRICE_SQL = """
+    INSERT INTO prices (merkey, price_case, price_pack, price_retail, cost, effective_date, is_current)
+    VALUES (?, ?, ?, ?, ?, date('now'), 1)
+"""
+
+# Maps a record's deletion-flag byte to 0 (deleted, '*') or 1 (live)
+_LIVE_FLAG_TABLE = bytes(0 if b == 0x2A else 1 for b in range(256))
+
 
 class FoxProDBF:
     """
@@ -37,6 +50,7 @@ class FoxProDBF:
         self.file = open(filename, 'rb')
         self._read_header()
         self._read_field_descriptors()
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
 
     def _read_header(self):
         header = self.file.read(32)
@@ -76,60 +90,95 @@ class FoxProDBF:
         # (record region begins exactly at header_length)
         self.data_start = self.header_length
 
-    def __iter__(self):
-        self.file.seek(self.data_start)
-
-        for _ in range(self.num_records):
-            record_data = self.file.read(self.record_length)
-            if not record_data:
-                break
-            if len(record_data) < self.record_length:
-                # partial read -> stop
-                break
+        # (name, type, decimals, start, end) per field
+        self._slots = []
+        offset = 1  # <-- FIX: skip deletion flag
+        for field in self.fields:
+            self._slots.append((field['name'], field['type'], field['decimals'],
+                                offset, offset + field['length']))
+            offset += field['length']
+
+        # Fixed record layout -> one precompiled Struct splits a record into
+        # per-field byte strings in C ('x' skips the deletion flag, trailing
+        # 'x' covers any padding after the last field).
+        fmt = '<x' + ''.join(f"{field['length']}s" for field in self.fields)
+        padding = self.record_length - offset
+        if padding > 0:
+            fmt += f'{padding}x'
+        self._record_struct = struct.Struct(fmt)
+
+    def _live_offsets(self):
+        """
+        Byte offsets of all non-deleted records.
+
+        The deletion flags are pulled out in one strided slice of the mmap
+        and filtered with translate/compress, so there is no per-record
+        Python branch on the flag byte.
+        """
+        rl = self.record_length
+        available = max(0, len(self.mm) - self.data_start) // rl
+        end = self.data_start + min(self.num_records, available) * rl  # partial tail -> stop
+
+        flags = self.mm[self.data_start:end:rl]
+        return itertools.compress(range(self.data_start, end, rl), flags.translate(_LIVE_FLAG_TABLE))
 
-            # Deletion flag is first byte
-            deleted_flag = record_data[0:1]
-            if deleted_flag == b'*':
-                continue
+    def __iter__(self):
+        mm = self.mm
+        unpack_from = self._record_struct.unpack_from
 
+        for base in self._live_offsets():
             record = {}
-            offset = 1  # <-- FIX: skip deletion flag
-
-            for field in self.fields:
-                raw = record_data[offset:offset + field['length']]
-                offset += field['length']
-
-                # Decode for character fields; numeric/date handled below
-                text = raw.decode('latin1', errors='ignore').strip()
-
-                if field['type'] == 'N':
-                    if text:
+            for (name, field_type, decimals, _, _), raw in zip(self._slots, unpack_from(mm, base)):
+                if field_type == 'N':
+                    # int()/float() parse ASCII bytes directly, no decode needed
+                    raw = raw.strip()
+                    if raw:
                         try:
-                            if field['decimals'] > 0:
-                                record[field['name']] = float(text)
+                            if decimals > 0:
+                                record[name] = float(raw)
                             else:
-                                record[field['name']] = int(text)
+                                record[name] = int(raw)
                         except ValueError:
-                            record[field['name']] = None
+                            record[name] = None
                     else:
-                        record[field['name']] = None
+                        record[name] = None
 
-                elif field['type'] == 'D':
+                elif field_type == 'D':
+                    text = raw.decode('latin1').strip()
                     if text and len(text) == 8:
                         try:
-                            record[field['name']] = datetime.strptime(text, '%Y%m%d').date()
+                            record[name] = datetime.strptime(text, '%Y%m%d').date()
                         except ValueError:
-                            record[field['name']] = None
+                            record[name] = None
                     else:
-                        record[field['name']] = None
+                        record[name] = None
 
                 else:
                     # Character or other types: keep as string or None
-                    record[field['name']] = text if text else None
+                    text = raw.decode('latin1').strip()
+                    record[name] = text if text else None
 
             yield record
 
+    def iter_field(self, name: str):
+        """
+        Yield a single character field (stripped text) for every live record.
+
+        Only that field's byte slot is decoded — no per-record dict and no
+        parsing of the other fields.
+        """
+        for field_name, _, _, start, end in self._slots:
+            if field_name == name:
+                break
+        else:
+            raise KeyError(f"Field not found: {name}")
+
+        mm = self.mm
+        for base in self._live_offsets():
+            yield mm[base + start:base + end].decode('latin1').strip()
+
     def close(self):
+        self.mm.close()
         self.file.close()
 
     def __enter__(self):
@@ -142,6 +191,10 @@ class FoxProDBF:
 def get_db():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-200000")
     return conn
 
 
@@ -198,8 +251,32 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
 
         debug_merkeys = []
 
+        # Load product keys and current prices once instead of two SELECTs
+        # per FPB record.
+        cursor.execute("SELECT merkey FROM products")
+        valid_merkeys = {row[0] for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT merkey, price_case, price_pack, price_retail, cost
+            FROM prices
+            WHERE is_current = 1
+        """)
+        current_prices = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+        # Pending price INSERTs, flushed with executemany. current_prices is
+        # updated as rows are queued, so a MERKEY repeated later in the file is
+        # compared against the price it is about to get, not the stale one.
+        price_batch = []
+
+        def flush_prices():
+            if price_batch:
+                cursor.executemany(INSERT_PRICE_SQL, price_batch)
+                price_batch.clear()
+
         with FoxProDBF(fpb_path) as dbf:
-            active_merkeys = set()
+            # Every non-blank MERKEY in the file counts as active, regardless
+            # of prices — collect them in a dedicated single-field pass.
+            active_merkeys = frozenset(mk for mk in dbf.iter_field('MERKEY') if mk)
 
             for row in dbf:
                 stats['processed'] += 1
@@ -220,8 +297,6 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
                     stats['skipped'] += 1
                     continue
 
-                active_merkeys.add(merkey)
-
                 # Extract prices (float/int already parsed for N types)
                 mode1_price = row.get('MEWHOP') or 0.0
                 mode2_price = row.get('MERET2') or 0.0
@@ -232,9 +307,7 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
                     stats['skipped'] += 1
                     continue
 
-                cursor.execute("SELECT merkey FROM products WHERE merkey = ?", (merkey,))
-                product_exists = cursor.fetchone() is not None
-                if not product_exists:
+                if merkey not in valid_merkeys:
                     stats['skipped'] += 1
                     continue
 
@@ -254,33 +327,29 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
                         if cursor.rowcount:
                             stats['barcodes_added'] += 1
 
-                cursor.execute("""
-                    SELECT price_case, price_pack, price_retail, cost
-                    FROM prices
-                    WHERE merkey = ? AND is_current = 1
-                """, (merkey,))
-                current_price = cursor.fetchone()
+                new_price = (mode1_price, mode2_price, mode3_price, cost)
+
+                current_price = current_prices.get(merkey)
 
                 price_changed = False
                 if current_price:
-                    if (current_price['price_case'] != mode1_price or
-                        current_price['price_pack'] != mode2_price or
-                        current_price['price_retail'] != mode3_price or
-                        current_price['cost'] != cost):
+                    if current_price != new_price:
                         price_changed = True
                         stats['price_changes'] += 1
 
                 if not current_price or price_changed:
-                    cursor.execute("""
-                        INSERT INTO prices (merkey, price_case, price_pack, price_retail, cost, effective_date, is_current)
-                        VALUES (?, ?, ?, ?, ?, date('now'), 1)
-                    """, (merkey, mode1_price, mode2_price, mode3_price, cost))
+                    price_batch.append((merkey,) + new_price)
+                    current_prices[merkey] = new_price
+                    if len(price_batch) >= PRICE_BATCH_SIZE:
+                        flush_prices()
 
                     if current_price:
                         stats['prices_updated'] += 1
                     else:
                         stats['prices_added'] += 1
 
+            flush_prices()
+
             print(f"✓ Processed {stats['processed']:,} records from MP_MER.FPB")
             print()
             print("DEBUG - First 20 MERKEYs read from file:")
@@ -1,41 +1,133 @@
 #!/usr/bin/env python3
 """
-Daily MP_MER.FPB Sync Script - Using DBF library
+Daily MP_MER.FPB Sync Script - Raw DBF field reader
 Anson Supermart Catalog Management
 """
 
 import sqlite3
 import os
+import struct
+from functools import lru_cache
 from datetime import datetime
 
 # Configuration
 DB_PATH = 'anson_products.db'
 SOURCE_FPB = r'D:\Projects\CatalogAutomation\Data\MP_MER.FPB'
 
+INSERT_PRICE_SQL = """
+    INSERT INTO prices (merkey, price_case, price_pack, price_retail, cost, effective_date, is_current)
+    VALUES (?, ?, ?, ?, ?, date('now'), 1)
+"""
+
+# Only these MP_MER.FPB fields are read; everything else is left undecoded
+PRICE_FIELDS = ('MERKEY', 'MEWHOP', 'MERET2', 'MERETP', 'MECOS0')
+
+# Records per read() call when scanning the record region
+READ_CHUNK_RECORDS = 4096
+
+def iter_dbf_fields(fpb_path, field_names):
+    """
+    Yield a tuple of raw field bytes (in field_names order) per live record.
+
+    The header is parsed once for each field's byte offset and compiled into
+    a struct layout that holds only the requested columns (everything else is
+    'x' padding). Each chunk of the record region is then split with
+    Struct.iter_unpack, so the per-record slicing happens in C.
+    Deleted records ('*' flag) are skipped.
+    """
+    with open(fpb_path, 'rb') as f:
+        header = f.read(32)
+        if len(header) != 32:
+            raise ValueError("Invalid DBF header (too short).")
+        num_records, header_length, record_length = struct.unpack('<IHH', header[4:12])
+        
+        slots = {}
+        offset = 1  # skip deletion flag
+        while True:
+            field_data = f.read(32)
+            if len(field_data) < 32 or field_data[0] == 0x0D:
+                break
+            name = field_data[0:11].split(b'\x00', 1)[0].decode('latin1').strip().upper()
+            slots[name] = (offset, offset + field_data[16])
+            offset += field_data[16]
+        
+        missing = [name for name in field_names if name not in slots]
+        if missing:
+            raise ValueError(f"Fields not found in {fpb_path}: {', '.join(missing)}")
+        
+        # Record layout: deletion flag as an int, wanted fields in file order
+        fmt = '<B'
+        position = 1
+        in_file_order = sorted(set(field_names), key=lambda name: slots[name][0])
+        for name in in_file_order:
+            start, end = slots[name]
+            if start > position:
+                fmt += f'{start - position}x'
+            fmt += f'{end - start}s'
+            position = end
+        if record_length > position:
+            fmt += f'{record_length - position}x'
+        record_struct = struct.Struct(fmt)
+        
+        # Unpacked tuple index (1-based past the flag) for each requested name
+        index = [in_file_order.index(name) + 1 for name in field_names]
+        
+        f.seek(header_length)
+        remaining = num_records
+        while remaining > 0:
+            wanted_count = min(remaining, READ_CHUNK_RECORDS)
+            chunk = f.read(record_length * wanted_count)
+            count = len(chunk) // record_length
+            for record in record_struct.iter_unpack(memoryview(chunk)[:count * record_length]):
+                if record[0] == 0x2A:  # deleted
+                    continue
+                yield tuple([record[i] for i in index])
+            if count < wanted_count:
+                break  # partial read -> stop
+            remaining -= count
+
+@lru_cache(maxsize=65536)
+def parse_price(raw):
+    """
+    FoxPro numeric field bytes -> float (blank or invalid -> 0.0)
+    
+    Cached on the raw field bytes: a price file only holds a few thousand
+    distinct price strings, so most records resolve with one C-level lookup.
+    """
+    raw = raw.strip()
+    if not raw:
+        return 0.0
+    try:
+        return float(raw)
+    except ValueError:
+        return 0.0
+
 def get_db():
     """Get database connection"""
-    conn = sqlite3.connect(DB_PATH)
+    # Autocommit mode: transactions are opened explicitly (BEGIN IMMEDIATE)
+    conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=30.0)
     conn.row_factory = sqlite3.Row
+    # WAL lets the web encoder keep reading while the sync writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA cache_size=-200000")
     return conn
 
-def sync_prices_from_mp_mer(fpb_path, dry_run=False):
-    """Sync prices from MP_MER.FPB using dbf library"""
-    print("=" * 80)
-    print("SYNCING PRICES FROM MP_MER.FPB")
-    print("=" * 80)
-    print(f"Source file: {fpb_path}")
-    print(f"Database: {DB_PATH}")
-    print(f"Dry run: {dry_run}")
-    print()
-    
-    # Install dbf library if needed
-    try:
-        from dbf import Table
-    except ImportError:
-        print("Installing dbf library...")
-        import subprocess
-        subprocess.check_call(['pip', 'install', 'dbf', '--break-system-packages'])
-        from dbf import Table
+def _silent(*args, **kwargs):
+    """log() stand-in for --quiet"""
+
+def sync_prices_from_mp_mer(fpb_path, dry_run=False, log=print):
+    """Sync prices from MP_MER.FPB (raw field reader)"""
+    log("=" * 80)
+    log("SYNCING PRICES FROM MP_MER.FPB")
+    log("=" * 80)
+    log(f"Source file: {fpb_path}")
+    log(f"Database: {DB_PATH}")
+    log(f"Dry run: {dry_run}")
+    log()
     
     if not os.path.exists(fpb_path):
         raise FileNotFoundError(f"MP_MER.FPB not found at {fpb_path}")
@@ -51,104 +143,110 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
     conn = get_db()
     cursor = conn.cursor()
     
-    # Start sync log
+    # Start sync log (autocommitted, so the IN_PROGRESS row is visible at once)
     cursor.execute("""
         INSERT INTO sync_log (sync_type, source_file, status, started_at)
         VALUES ('MP_MER_PRICE_SYNC', ?, 'IN_PROGRESS', CURRENT_TIMESTAMP)
     """, (fpb_path,))
     sync_log_id = cursor.lastrowid
-    conn.commit()
     
     try:
-        print("Opening MP_MER.FPB with dbf library...")
+        log("Reading MP_MER.FPB...")
         
-        # Open FoxPro table
-        table = Table(fpb_path)
-        table.open()
+        with open(fpb_path, 'rb') as f:
+            total_records = struct.unpack('<I', f.read(8)[4:8])[0]
         
-        print(f"Total records: {len(table):,}")
-        print()
+        log(f"Total records: {total_records:,}")
+        log()
         
-        # Debug: show first 10 MERKEYs
-        print("DEBUG - First 10 MERKEYs from file:")
-        for i, record in enumerate(table):
-            if i >= 10:
-                break
-            merkey = record.merkey.strip() if record.merkey else None
-            print(f"  {i+1}. '{merkey}'")
+        log("Processing records...")
+        log("DEBUG - First 10 MERKEYs from file:")
         
-        print()
-        print("Processing records...")
+        # Progress/debug lines are skipped outright (not just formatted and
+        # dropped) when running quiet
+        verbose = log is not _silent
         
         active_merkeys = set()
         
-        for record in table:
+        # Take the write lock up front rather than upgrading mid-batch, so
+        # the sync waits on busy_timeout here instead of hitting SQLITE_BUSY
+        # halfway through; WAL readers (web encoder) are not blocked
+        cursor.execute("BEGIN IMMEDIATE")
+        
+        # Load product keys and current prices once instead of two SELECTs
+        # per DBF record
+        cursor.execute("SELECT merkey FROM products")
+        valid_merkeys = {row[0] for row in cursor.fetchall()}
+        
+        cursor.execute("""
+            SELECT merkey, price_case, price_pack, price_retail, cost
+            FROM prices
+            WHERE is_current = 1
+        """)
+        current_prices = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+        
+        # Pass 1: scan the file, keeping the last usable price per MERKEY so
+        # variant/obsolete duplicates collapse before any DB work
+        latest_prices = {}
+        for raw_merkey, *raw_prices in iter_dbf_fields(fpb_path, PRICE_FIELDS):
             stats['processed'] += 1
             
-            if stats['processed'] % 5000 == 0:
-                print(f"  Processed {stats['processed']:,} records...")
+            if verbose and stats['processed'] % 5000 == 0:
+                log(f"  Processed {stats['processed']:,} records...")
             
             # Get MERKEY
-            merkey = record.merkey.strip() if record.merkey else None
+            merkey = raw_merkey.decode('latin1').strip()
+            
+            # Debug: show first 10 MERKEYs (same pass, no second table scan)
+            if verbose and stats['processed'] <= 10:
+                log(f"  {stats['processed']}. '{merkey}'")
+            
             if not merkey:
                 stats['skipped'] += 1
                 continue
             
             active_merkeys.add(merkey)
             
-            # Get prices
-            mode1_price = float(record.mewhop) if record.mewhop else 0.0
-            mode2_price = float(record.meret2) if record.meret2 else 0.0
-            mode3_price = float(record.meretp) if record.meretp else 0.0
-            cost = float(record.mecos0) if record.mecos0 else 0.0
+            # Get prices (case, pack, retail, cost) in one pass
+            new_price = tuple(map(parse_price, raw_prices))
             
             # Skip if no prices
-            if mode1_price == 0 and mode2_price == 0 and mode3_price == 0:
+            if new_price[0] == 0 and new_price[1] == 0 and new_price[2] == 0:
                 stats['skipped'] += 1
                 continue
             
             # Check if product exists in database
-            cursor.execute("SELECT merkey FROM products WHERE merkey = ?", (merkey,))
-            if not cursor.fetchone():
+            if merkey not in valid_merkeys:
                 stats['skipped'] += 1
                 continue
             
-            # Get current price
-            cursor.execute("""
-                SELECT price_case, price_pack, price_retail, cost
-                FROM prices
-                WHERE merkey = ? AND is_current = 1
-            """, (merkey,))
-            
-            current_price = cursor.fetchone()
-            
-            # Check if price changed
-            price_changed = False
-            if current_price:
-                if (current_price['price_case'] != mode1_price or
-                    current_price['price_pack'] != mode2_price or
-                    current_price['price_retail'] != mode3_price or
-                    current_price['cost'] != cost):
-                    price_changed = True
-                    stats['price_changes'] += 1
-            
-            # Insert new price record
-            if not current_price or price_changed:
-                cursor.execute("""
-                    INSERT INTO prices (merkey, price_case, price_pack, price_retail, cost, effective_date, is_current)
-                    VALUES (?, ?, ?, ?, ?, date('now'), 1)
-                """, (merkey, mode1_price, mode2_price, mode3_price, cost))
+            latest_prices[merkey] = new_price
+        
+        def changed_prices():
+            """
+            Pass 2: yield (merkey, case, pack, retail, cost) for every new or
+            changed price, one row per MERKEY. Fed straight into executemany,
+            so rows stream into SQLite without building a list.
+            """
+            for merkey, new_price in latest_prices.items():
+                # Unchanged price (the common case) -> one tuple compare
+                current_price = current_prices.get(merkey)
+                if current_price == new_price:
+                    continue
                 
-                if current_price:
-                    stats['prices_updated'] += 1
-                else:
+                if current_price is None:
                     stats['prices_added'] += 1
+                else:
+                    stats['price_changes'] += 1
+                    stats['prices_updated'] += 1
+                
+                yield (merkey,) + new_price
         
-        table.close()
+        cursor.executemany(INSERT_PRICE_SQL, changed_prices())
         
-        print(f"✓ Processed {stats['processed']:,} records")
-        print(f"  Found {len(active_merkeys):,} unique MERKEYs")
-        print()
+        log(f"✓ Processed {stats['processed']:,} records")
+        log(f"  Found {len(active_merkeys):,} unique MERKEYs")
+        log()
         
         # Update sync log
         if not dry_run:
@@ -164,14 +262,16 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
             """, (stats['processed'], stats['prices_updated'], stats['prices_added'],
                   stats['skipped'], sync_log_id))
             
-            conn.commit()
-            print("✓ Changes committed to database")
+            cursor.execute("COMMIT")
+            log("✓ Changes committed to database")
         else:
-            conn.rollback()
-            print("✗ Dry run - changes rolled back")
+            cursor.execute("ROLLBACK")
+            log("✗ Dry run - changes rolled back")
         
     except Exception as e:
         stats['errors'] = [str(e)]
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
         cursor.execute("""
             UPDATE sync_log
             SET status = 'FAILED',
@@ -179,7 +279,6 @@ def sync_prices_from_mp_mer(fpb_path, dry_run=False):
                 completed_at = CURRENT_TIMESTAMP
             WHERE id = ?
         """, (str(e), sync_log_id))
-        conn.commit()
         raise
     
     finally:
@@ -194,36 +293,38 @@ def main():
     parser = argparse.ArgumentParser(description='Sync MP_MER.FPB prices to database')
     parser.add_argument('--source', default=SOURCE_FPB, help='Path to MP_MER.FPB file')
     parser.add_argument('--dry-run', action='store_true', help='Test run without committing changes')
+    parser.add_argument('--quiet', action='store_true', help='Only print errors (for scheduled runs)')
     
     args = parser.parse_args()
+    log = _silent if args.quiet else print
     
-    print("=" * 80)
-    print("MP_MER.FPB DAILY PRICE SYNC")
-    print("=" * 80)
-    print(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print()
+    log("=" * 80)
+    log("MP_MER.FPB DAILY PRICE SYNC")
+    log("=" * 80)
+    log(f"Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log()
     
     try:
-        stats = sync_prices_from_mp_mer(args.source, dry_run=args.dry_run)
+        stats = sync_prices_from_mp_mer(args.source, dry_run=args.dry_run, log=log)
         
         # Print summary
-        print()
-        print("=" * 80)
-        print("SYNC SUMMARY")
-        print("=" * 80)
-        print(f"Records processed:     {stats['processed']:,}")
-        print(f"Prices updated:        {stats['prices_updated']:,}")
-        print(f"Prices added:          {stats['prices_added']:,}")
-        print(f"Price changes:         {stats['price_changes']:,}")
-        print(f"Skipped:               {stats['skipped']:,}")
-        print("=" * 80)
+        log()
+        log("=" * 80)
+        log("SYNC SUMMARY")
+        log("=" * 80)
+        log(f"Records processed:     {stats['processed']:,}")
+        log(f"Prices updated:        {stats['prices_updated']:,}")
+        log(f"Prices added:          {stats['prices_added']:,}")
+        log(f"Price changes:         {stats['price_changes']:,}")
+        log(f"Skipped:               {stats['skipped']:,}")
+        log("=" * 80)
         
         if args.dry_run:
-            print("✓ DRY RUN COMPLETE - No changes committed")
+            log("✓ DRY RUN COMPLETE - No changes committed")
         else:
-            print("✓ SYNC COMPLETE")
+            log("✓ SYNC COMPLETE")
         
-        print("=" * 80)
+        log("=" * 80)
         
         return 0
         
@@ -1,6 +1,9 @@
 from __future__ import annotations
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, g
+import functools
+import queue
 import sqlite3
+import time
 from pathlib import Path
 from datetime import datetime
 import os, re
@@ -22,18 +25,182 @@ S3_BUCKET = "ansonsupermart.com"
 S3_PREFIX = "images/"
 S3_REGION = "ap-southeast-1"
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Keep-alive connections reused across requests (see get_db / release_db)
+DB_POOL_SIZE = 8
+_db_pool: queue.Queue[sqlite3.Connection] = queue.Queue(maxsize=DB_POOL_SIZE)
+
+# Indexes the list/dashboard queries rely on (also in schema.sql); created
+# once per process so databases built from an older schema pick them up.
+INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_images_primary ON images(merkey) WHERE is_primary = 1;
+CREATE INDEX IF NOT EXISTS idx_products_filter ON products(active, needs_enrichment, data_quality, merkey);
+"""
+_indexes_checked = False
+
+# Full-text index behind the products_list search box (also in schema.sql).
+# External-content table: only the inverted index is stored, and the triggers
+# keep it in step with products. Built from existing rows on first creation.
+FTS_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    merkey, description, name, content='products', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, merkey, description, name)
+    VALUES (new.rowid, new.merkey, new.description, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, merkey, description, name)
+    VALUES ('delete', old.rowid, old.merkey, old.description, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF merkey, description, name ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, merkey, description, name)
+    VALUES ('delete', old.rowid, old.merkey, old.description, old.name);
+    INSERT INTO products_fts(rowid, merkey, description, name)
+    VALUES (new.rowid, new.merkey, new.description, new.name);
+END;
+INSERT INTO products_fts(products_fts) VALUES ('rebuild');
+"""
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON;")
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute("PRAGMA busy_timeout = 30000;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    conn.execute("PRAGMA mmap_size = 268435456;")
+    global _indexes_checked
+    if not _indexes_checked:
+        conn.executescript(INDEX_DDL)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name='products_fts'").fetchone() is None:
+            conn.executescript(FTS_DDL)
+        _indexes_checked = True
     return conn
 
+def get_db():
+    """Request-scoped connection, checked out of the pool (opened on demand)."""
+    if "db" not in g:
+        try:
+            g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            g.db = _connect()
+    return g.db
+
+@app.teardown_request
+def release_db(exc):
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    conn.rollback()  # never hand an open transaction to the next request
+    try:
+        _db_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+# SQL text is built once per shape (dashboard scope / list filter combination)
+# and reused verbatim, so each connection's statement cache always hits.
+# Filter predicates stay literal (not "?=0 OR ...") so the indexes still apply.
+def _dashboard_sql(where: str) -> tuple[str, str]:
+    stats_sql = f"""
+      SELECT COUNT(*) as total_scope,
+             SUM(CASE WHEN p.needs_enrichment=1 THEN 1 ELSE 0 END) as needs_work,
+             SUM(CASE WHEN p.data_quality='COMPLETE' THEN 1 ELSE 0 END) as complete,
+             SUM(CASE WHEN img.id IS NULL THEN 1 ELSE 0 END) as missing_photos
+      FROM products p
+      LEFT JOIN images img ON p.merkey=img.merkey AND img.is_primary=1
+      WHERE {where}
+    """
+    breakdown_sql = f"""
+      SELECT p.data_quality, COUNT(*) as count
+      FROM products p
+      WHERE {where} AND p.needs_enrichment=1
+      GROUP BY p.data_quality
+      ORDER BY count DESC
+    """
+    return stats_sql, breakdown_sql
+
+DASHBOARD_SQL = {"all": _dashboard_sql("1=1"), "active": _dashboard_sql("p.active=1")}
+
+@functools.lru_cache(maxsize=None)
+def _products_list_sql(active_only: bool, filter_kind: str, missing_photos: bool, search_kind: str,
+                       keyset: bool) -> tuple[str, str]:
+    """(count_sql, page_sql) for one products_list filter combination."""
+    where = []
+    if active_only: where.append("p.active=1")
+    if filter_kind=="needs_work": where.append("p.needs_enrichment=1")
+    elif filter_kind=="pending_deletion": where.append("p.pending_deletion=1")
+    elif filter_kind=="quality": where.append("p.data_quality=?")
+    if missing_photos: where.append("img.id IS NULL")
+    if search_kind=="fts": where.append("p.rowid IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+    elif search_kind=="like":
+        where.append("(p.description LIKE ? ESCAPE '\\' OR p.merkey LIKE ? ESCAPE '\\' OR p.name LIKE ? ESCAPE '\\')")
+    where_sql = " AND ".join(where) if where else "1=1"
+
+    count_sql = f"""
+      SELECT COUNT(*) as cnt
+      FROM products p
+      LEFT JOIN images img ON p.merkey=img.merkey AND img.is_primary=1
+      WHERE {where_sql}
+    """
+
+    # Keyset pagination: seek past the (missing_photo, txn_count_24m, merkey)
+    # sort key of the previous page's last row
+    if keyset:
+        where_sql += """
+        AND (CASE WHEN img.id IS NULL THEN 1 ELSE 0 END < ?
+             OR (CASE WHEN img.id IS NULL THEN 1 ELSE 0 END = ?
+                 AND (COALESCE(s.txn_count_24m,0) < ?
+                      OR (COALESCE(s.txn_count_24m,0) = ? AND p.merkey > ?))))"""
+
+    page_sql = f"""
+      SELECT p.merkey, p.description, p.name, p.size, p.data_quality, p.needs_enrichment,
+             p.pending_deletion, p.active,
+             b.name as brand, c.name as category,
+             COALESCE(s.txn_count_24m,0) as txn_count_24m,
+             CASE WHEN img.id IS NULL THEN 1 ELSE 0 END as missing_photo
+      FROM products p
+      LEFT JOIN brands b ON p.brand_id=b.id
+      LEFT JOIN categories c ON p.category_id=c.id
+      LEFT JOIN sales_metrics s ON p.merkey=s.merkey
+      LEFT JOIN images img ON p.merkey=img.merkey AND img.is_primary=1
+      WHERE {where_sql}
+      ORDER BY missing_photo DESC, txn_count_24m DESC, p.merkey ASC
+      LIMIT ? OFFSET ?
+    """
+    return count_sql, page_sql
+
+# products_list result counts are reused for this many seconds per filter combo
+COUNT_CACHE_SECONDS = 30
+
+@functools.lru_cache(maxsize=64)
+def _cached_count(count_sql: str, params: tuple, time_bucket: int) -> int:
+    # time_bucket only makes the cache key expire every COUNT_CACHE_SECONDS
+    cur = get_db().cursor()
+    cur.execute(count_sql, params)
+    return cur.fetchone()["cnt"]
+
+_SLUG_STRIP_RE = re.compile(r"[^\w\s-]")
+_SLUG_SPACES_RE = re.compile(r"[\s/]+")
+_SLUG_DASHES_RE = re.compile(r"-{2,}")
+
+# ASCII fast path: one translate() pass drops what _SLUG_STRIP_RE would remove
+# and turns each space into "-" (runs are collapsed by _SLUG_DASHES_RE after).
+_SLUG_ASCII_TABLE = str.maketrans({
+    chr(c): (None if _SLUG_STRIP_RE.match(chr(c)) else "-")
+    for c in range(128)
+    if _SLUG_STRIP_RE.match(chr(c)) or _SLUG_SPACES_RE.match(chr(c))
+})
+
 def slugify(text: str) -> str:
     text = (text or "").strip().lower()
-    text = re.sub(r"[^\w\s-]", "", text)
-    text = re.sub(r"[\s/]+", "-", text)
-    text = text.replace("&", "and")
-    text = re.sub(r"-{2,}", "-", text)
+    if text.isascii():
+        text = text.translate(_SLUG_ASCII_TABLE)
+    else:
+        text = _SLUG_STRIP_RE.sub("", text)
+        text = _SLUG_SPACES_RE.sub("-", text)
+        text = text.replace("&", "and")
+    text = _SLUG_DASHES_RE.sub("-", text)
     return text.strip("-")
 
 def compute_quality(description: str, name: str, brand_id: int|None, category_id: int|None, size: str) -> tuple[str,int]:
@@ -46,6 +213,22 @@ def compute_quality(description: str, name: str, brand_id: int|None, category_id
     if not issues: return "COMPLETE", 0
     return issues[0], 1
 
+# brands/categories/departments lists for the edit form; refreshed at most
+# every DROPDOWN_CACHE_SECONDS, or right away when product_update adds a brand
+DROPDOWN_CACHE_SECONDS = 60
+_dropdown_cache: dict = {"ts": 0.0}
+
+def get_dropdowns(cur) -> dict:
+    if time.monotonic() - _dropdown_cache["ts"] >= DROPDOWN_CACHE_SECONDS:
+        _dropdown_cache.update(
+            brands=[dict(r) for r in cur.execute("SELECT id,name FROM brands ORDER BY name")],
+            categories=[dict(r) for r in cur.execute("SELECT id,name FROM categories ORDER BY name")],
+            departments=[dict(r) for r in cur.execute("SELECT id,name FROM departments ORDER BY name")],
+            ts=time.monotonic(),
+        )
+        _dropdown_cache["brand_names"] = frozenset(b["name"] for b in _dropdown_cache["brands"])
+    return _dropdown_cache
+
 def get_primary_barcode(cur, merkey: str) -> str|None:
     cur.execute("SELECT barcode FROM barcodes WHERE merkey=? ORDER BY is_primary DESC, id ASC LIMIT 1", (merkey,))
     r = cur.fetchone()
@@ -55,33 +238,18 @@ def get_primary_barcode(cur, merkey: str) -> str|None:
 def index():
     scope = request.args.get("scope","active")
     conn = get_db(); cur = conn.cursor()
-    where = "1=1" if scope=="all" else "p.active=1"
+    stats_sql, breakdown_sql = DASHBOARD_SQL["all" if scope=="all" else "active"]
 
     cur.execute("SELECT COUNT(*) as c FROM products"); total_all = cur.fetchone()["c"]
     cur.execute("SELECT COUNT(*) as c FROM products WHERE active=1"); total_active = cur.fetchone()["c"]
 
-    cur.execute(f"""
-      SELECT COUNT(*) as total_scope,
-             SUM(CASE WHEN p.needs_enrichment=1 THEN 1 ELSE 0 END) as needs_work,
-             SUM(CASE WHEN p.data_quality='COMPLETE' THEN 1 ELSE 0 END) as complete,
-             SUM(CASE WHEN img.id IS NULL THEN 1 ELSE 0 END) as missing_photos
-      FROM products p
-      LEFT JOIN images img ON p.merkey=img.merkey AND img.is_primary=1
-      WHERE {where}
-    """)
+    cur.execute(stats_sql)
     s = dict(cur.fetchone())
     cur.execute("SELECT COUNT(*) as c FROM products WHERE pending_deletion=1")
     pending_deletion_count = cur.fetchone()["c"]
 
-    cur.execute(f"""
-      SELECT p.data_quality, COUNT(*) as count
-      FROM products p
-      WHERE {where} AND p.needs_enrichment=1
-      GROUP BY p.data_quality
-      ORDER BY count DESC
-    """)
+    cur.execute(breakdown_sql)
     breakdown = [dict(r) for r in cur.fetchall()]
-    conn.close()
     return render_template("dashboard.html", stats={
         "scope": scope,
         "total_all": total_all,
@@ -93,6 +261,12 @@ def index():
         "pending_deletion": pending_deletion_count,
     }, breakdown=breakdown)
 
+_FTS_TOKEN_RE = re.compile(r"[^\W_]+")
+
+def _fts_query(search: str) -> str:
+    """Search box text -> FTS5 MATCH string: every word, as a quoted prefix."""
+    return " ".join(f'"{t}"*' for t in _FTS_TOKEN_RE.findall(search))
+
 @app.route("/products")
 def products_list():
     scope = request.args.get("scope","active")
@@ -104,49 +278,52 @@ def products_list():
     search = (request.args.get("search","") or "").strip()
     missing_photos = request.args.get("missing_photos","0") == "1"
 
-    where=[]; params=[]
-    if scope=="active": where.append("p.active=1")
-    if filter_type=="needs_work": where.append("p.needs_enrichment=1")
-    elif filter_type=="pending_deletion": where.append("p.pending_deletion=1")
-    elif filter_type=="all": pass
+    if filter_type in ("needs_work", "pending_deletion", "all"):
+        filter_kind = filter_type; params = []
     else:
-        where.append("p.data_quality=?"); params.append(filter_type)
-    if missing_photos: where.append("img.id IS NULL")
-    if search:
-        where.append("(p.description LIKE ? OR p.merkey LIKE ? OR p.name LIKE ?)")
-        params.extend([f"%{search}%", f"%{search}%", f"%{search}%"])
-    where_sql = " AND ".join(where) if where else "1=1"
+        filter_kind = "quality"; params = [filter_type]
+    fts_query = _fts_query(search)
+    if fts_query:
+        search_kind = "fts"; params.append(fts_query)
+    elif search:
+        # No indexable words (only punctuation/underscores): FTS cannot match
+        # it, so filter with LIKE (wildcards escaped) rather than dropping the search
+        pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        search_kind = "like"; params.extend([f"%{pattern}%"] * 3)
+    else:
+        search_kind = ""
 
-    conn=get_db(); cur=conn.cursor()
-    cur.execute(f"""
-      SELECT COUNT(*) as cnt
-      FROM products p
-      LEFT JOIN images img ON p.merkey=img.merkey AND img.is_primary=1
-      WHERE {where_sql}
-    """, params)
-    total = cur.fetchone()["cnt"]
+    # Keyset pagination: "Next" links carry the sort key of the last row shown,
+    # so the next page seeks straight past it instead of walking OFFSET rows.
+    # Numbered page links still use OFFSET for jumping around.
+    after_merkey = request.args.get("after_merkey")
+    count_sql, page_sql = _products_list_sql(scope=="active", filter_kind, missing_photos, search_kind,
+                                             after_merkey is not None)
 
-    cur.execute(f"""
-      SELECT p.merkey, p.description, p.name, p.size, p.data_quality, p.needs_enrichment,
-             p.pending_deletion, p.active,
-             b.name as brand, c.name as category,
-             COALESCE(s.txn_count_24m,0) as txn_count_24m,
-             CASE WHEN img.id IS NULL THEN 1 ELSE 0 END as missing_photo
-      FROM products p
-      LEFT JOIN brands b ON p.brand_id=b.id
-      LEFT JOIN categories c ON p.category_id=c.id
-      LEFT JOIN sales_metrics s ON p.merkey=s.merkey
-      LEFT JOIN images img ON p.merkey=img.merkey AND img.is_primary=1
-      WHERE {where_sql}
-      ORDER BY missing_photo DESC, txn_count_24m DESC, p.merkey ASC
-      LIMIT ? OFFSET ?
-    """, params + [per_page, offset])
+    total = _cached_count(count_sql, tuple(params), int(time.monotonic() // COUNT_CACHE_SECONDS))
+
+    page_params = list(params)
+    if after_merkey is not None:
+        after_missing = request.args.get("after_missing_photo", 0, type=int)
+        after_txn = request.args.get("after_txn", 0, type=int)
+        page_params += [after_missing, after_missing, after_txn, after_txn, after_merkey]
+        offset = 0
+
+    conn=get_db(); cur=conn.cursor()
+    cur.execute(page_sql, page_params + [per_page + 1, offset])
     products=[dict(r) for r in cur.fetchall()]
-    conn.close()
+    has_next = len(products) > per_page
+    products = products[:per_page]
+    next_key = None
+    if has_next:
+        last = products[-1]
+        next_key = {"after_missing_photo": last["missing_photo"], "after_txn": last["txn_count_24m"],
+                    "after_merkey": last["merkey"]}
 
     total_pages = max(1, (total + per_page - 1)//per_page)
     return render_template("products_list.html", products=products, page=page, total_pages=total_pages, total=total,
-                           filter_type=filter_type, search=search, scope=scope, missing_photos=missing_photos, per_page=per_page)
+                           filter_type=filter_type, search=search, scope=scope, missing_photos=missing_photos, per_page=per_page,
+                           next_key=next_key)
 
 @app.route("/product/<merkey>")
 def product_edit(merkey):
@@ -165,15 +342,13 @@ def product_edit(merkey):
     """,(merkey,))
     row=cur.fetchone()
     if not row:
-        conn.close(); return "Product not found", 404
+        return "Product not found", 404
     product=dict(row)
 
-    brands=[dict(r) for r in cur.execute("SELECT id,name FROM brands ORDER BY name")]
-    categories=[dict(r) for r in cur.execute("SELECT id,name FROM categories ORDER BY name")]
-    departments=[dict(r) for r in cur.execute("SELECT id,name FROM departments ORDER BY name")]
+    dropdowns=get_dropdowns(cur)
     barcodes=[dict(r) for r in cur.execute("SELECT barcode,is_primary FROM barcodes WHERE merkey=? ORDER BY is_primary DESC, barcode ASC",(merkey,))]
-    conn.close()
-    return render_template("product_edit.html", product=product, brands=brands, categories=categories, departments=departments, barcodes=barcodes)
+    return render_template("product_edit.html", product=product, brands=dropdowns["brands"],
+                           categories=dropdowns["categories"], departments=dropdowns["departments"], barcodes=barcodes)
 
 @app.route("/product/<merkey>/update", methods=["POST"])
 def product_update(merkey):
@@ -191,12 +366,16 @@ def product_update(merkey):
 
     brand_id=None
     if brand_name:
-        cur.execute("SELECT id FROM brands WHERE name=?",(brand_name,))
-        r=cur.fetchone()
-        if r: brand_id=r["id"]
-        else:
-            cur.execute("INSERT INTO brands(name,slug) VALUES(?,?)",(brand_name,slugify(brand_name)))
-            brand_id=cur.lastrowid
+        # one statement for lookup-or-create; the no-op DO UPDATE makes
+        # RETURNING hand back the existing id on conflict
+        cur.execute("""
+          INSERT INTO brands(name,slug) VALUES(?,?)
+          ON CONFLICT(name) DO UPDATE SET slug=brands.slug
+          RETURNING id
+        """,(brand_name,slugify(brand_name)))
+        brand_id=cur.fetchone()["id"]
+        if brand_name not in _dropdown_cache.get("brand_names", ()):
+            _dropdown_cache["ts"] = 0.0  # new brand -> refresh the edit-form lists
 
     dq, ne = compute_quality(description,name,brand_id,category_id,size)
 
@@ -207,7 +386,8 @@ def product_update(merkey):
                           updated_at=CURRENT_TIMESTAMP
       WHERE merkey=?
     """,(description,name,brand_id,category_id,department_id,size,weight_volume,unit,dq,ne,notes or "Updated via web encoder", merkey))
-    conn.commit(); conn.close()
+    conn.commit()
+    _cached_count.cache_clear()
     return redirect(url_for("product_edit", merkey=merkey))
 
 @app.route("/products/purge-pending", methods=["POST"])
@@ -217,7 +397,8 @@ def purge_pending_deletion():
     cur.execute("SELECT COUNT(*) as c FROM products WHERE pending_deletion=1")
     count = cur.fetchone()["c"]
     cur.execute("DELETE FROM products WHERE pending_deletion=1")
-    conn.commit(); conn.close()
+    conn.commit()
+    _cached_count.cache_clear()
     flash(f"Deleted {count:,} products marked for deletion.", "success")
     return redirect(url_for("index"))
 
@@ -228,7 +409,8 @@ def product_restore(merkey):
       UPDATE products SET pending_deletion=0, active=1, updated_at=CURRENT_TIMESTAMP
       WHERE merkey=?
     """, (merkey,))
-    conn.commit(); conn.close()
+    conn.commit()
+    _cached_count.cache_clear()
     flash("Product restored — pending deletion flag cleared.", "success")
     return redirect(url_for("product_edit", merkey=merkey))
 
@@ -252,14 +434,19 @@ def upload_photo(merkey):
     result = process_to_white_bg(orig_path, processed_path, size=1200, padding_ratio=0.10, try_remove_bg=True)
 
     key=f"{S3_PREFIX}{identifier}.jpg"
+    # Upload before writing: the write lock is never held across the S3 PUT,
+    # and a failed upload raises before any row is inserted
     up=upload_file_to_s3(processed_path, key=key, bucket=S3_BUCKET, region=S3_REGION, content_type="image/jpeg", public_read=True)
 
-    cur.execute("UPDATE images SET is_primary=0 WHERE merkey=? AND is_primary=1",(merkey,))
-    cur.execute("""
-      INSERT INTO images(merkey, filename, s3_url, local_path, is_primary, width, height, file_size, uploaded_at)
-      VALUES(?,?,?,?,1,?,?,?,CURRENT_TIMESTAMP)
-    """,(merkey, f"{identifier}.jpg", up.url, str(processed_path), result.width, result.height, result.file_size))
-    conn.commit(); conn.close()
+    # One transaction, one statement: the ensure_single_primary_image trigger
+    # demotes the previous primary image (via idx_images_primary) on insert.
+    with conn:
+        cur.execute("""
+          INSERT INTO images(merkey, filename, s3_url, local_path, is_primary, width, height, file_size, uploaded_at)
+          VALUES(?,?,?,?,1,?,?,?,CURRENT_TIMESTAMP)
+        """,(merkey, f"{identifier}.jpg", up.url, str(processed_path),
+             result.width, result.height, result.file_size))
+    _cached_count.cache_clear()
 
     flash("Photo uploaded + processed + uploaded to S3 ✅","success")
     return redirect(url_for("product_edit", merkey=merkey))
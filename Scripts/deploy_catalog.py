@@ -11,8 +11,8 @@ INSTRUCTIONS:
 4. If satisfied, set up monthly automation
 """
 
-import subprocess
 import sys
+import traceback
 from pathlib import Path
 from datetime import datetime
 
@@ -39,6 +39,11 @@ MIN_TRANSACTIONS = 2
 # SCRIPT EXECUTION - DO NOT MODIFY BELOW THIS LINE
 # ============================================================================
 
+def count_lines(path):
+    """Count newlines in 1MB binary chunks (no per-line decoding)"""
+    with open(path, 'rb') as f:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+
 def main():
     print("=" * 100)
     print("ANSON SUPERMART CATALOG GENERATOR - PRODUCTION DEPLOYMENT")
@@ -60,27 +65,21 @@ def main():
         print("   Please update PRODUCT_DATABASE path in this script (line 23)")
         sys.exit(1)
     
-    # Build command
-    cmd = [
-        'python3',
-        'generate_sales_based_catalog.py',
-        SALES_FILES_PATTERN,
-        PRODUCT_DATABASE,
-        '-o', OUTPUT_CATALOG,
-        '--min-transactions', str(MIN_TRANSACTIONS)
-    ]
-    
     print("=" * 100)
     print("RUNNING CATALOG GENERATION")
     print("=" * 100)
     print()
-    print(f"Command: {' '.join(cmd)}")
-    print()
     
-    # Run the generator
-    result = subprocess.run(cmd, capture_output=False)
+    # Run the generator in this interpreter instead of spawning a new python3
+    from generate_sales_based_catalog import generate_catalog
+    try:
+        returncode = generate_catalog(SALES_FILES_PATTERN, PRODUCT_DATABASE,
+                                      OUTPUT_CATALOG, MIN_TRANSACTIONS)
+    except Exception:
+        traceback.print_exc()
+        returncode = 1
     
-    if result.returncode == 0:
+    if returncode == 0:
         print()
         print("=" * 100)
         print("✅ SUCCESS! CATALOG GENERATED")
@@ -96,8 +95,7 @@ def main():
             print(f"File size: {file_size:.2f} MB")
             
             # Count lines (products)
-            with open(OUTPUT_CATALOG, 'r', encoding='utf-8') as f:
-                product_count = sum(1 for line in f) - 1  # -1 for header
+            product_count = count_lines(OUTPUT_CATALOG) - 1  # -1 for header
             print(f"Products in catalog: {product_count:,}")
             print()
             
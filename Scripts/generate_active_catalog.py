@@ -8,20 +8,110 @@ Similar to Nielsen automation - processes FoxPro database and generates clean ca
 import struct
 import csv
 import sys
-from datetime import datetime, timedelta
+from contextlib import ExitStack
+from functools import lru_cache
+from datetime import datetime, timedelta, time
 from pathlib import Path
 from typing import List, Dict, Optional
 
 
+# MP_MER.FPB fields the catalog uses; the rest of each record is never parsed
+CATALOG_FIELDS = ('USRDAT', 'MERETP', 'MEDESC', 'MEAN13', 'BARCD1', 'MERKEY', 'SURKEY')
+
+# DBF header: record count, header length, record length (bytes 4-11)
+_HDR = struct.Struct('<IHH')
+
+# DBF field descriptor: name, type, (4 reserved), length, decimal count
+_FDESC = struct.Struct('<11sc4xBB')
+
+# Output CSV header; extract_product_info returns rows in this order
+CATALOG_COLUMNS = ('Brand', 'Name', 'Description', 'Size', 'Price', 'Photo', 'Cards', 'Search',
+                   'MERKEY', 'MEDESC', 'PRICEJP', 'Barcode', 'SURKEY', 'USRDAT')
+
+# Progress line every 16,384 records (power of two -> bitmask test), and only
+# when stdout is a terminal; redirected/cron output skips it entirely
+PROGRESS_MASK = 0x3FFF
+
+# Records per read() call when scanning the record region
+READ_CHUNK_RECORDS = 4096
+
+# Bytes that str.strip() removes from latin-1 text: stripping these from the
+# raw field and then decoding gives the same string as decode-then-strip
+_WHITESPACE = bytes(b for b in range(256) if chr(b).isspace())
+
+# Prices above this are treated as data-entry errors
+MAX_PRICE = 50000
+
+# Every valid MMDD (leap year, so 0229 included) for digit-only USRDAT checks
+_VALID_MMDD = frozenset((datetime(2000, 1, 1) + timedelta(days=d)).strftime('%m%d') for d in range(366))
+
+
+def iter_dbf_records(f, num_records: int, header_length: int, record_length: int,
+                     field_positions: Dict[str, tuple], names: tuple):
+    """
+    Yield (record_index, raw_values) for every live record, raw_values holding
+    the bytes of each field in `names` (None if the file has no such field).
+    
+    The record region is read in chunks and split with a struct layout that
+    covers only the requested fields ('x' padding elsewhere), so per-record
+    slicing happens in C. Deleted records are skipped; record_index still
+    counts them, matching the file position.
+    """
+    present = sorted({name for name in names if name in field_positions},
+                     key=lambda name: field_positions[name][0])
+    
+    fmt = '<c'  # deletion flag
+    position = 1
+    for name in present:
+        pos, length = field_positions[name][:2]
+        if pos > position:
+            fmt += f'{pos - position}x'
+        fmt += f'{length}s'
+        position = pos + length
+    if record_length > position:
+        fmt += f'{record_length - position}x'
+    record_struct = struct.Struct(fmt)
+    
+    # Unpacked tuple index for each requested name (0 -> not in file)
+    index = [present.index(name) + 1 if name in field_positions else 0 for name in names]
+    
+    f.seek(header_length)
+    record_index = 0
+    remaining = num_records
+    while remaining > 0:
+        wanted = min(remaining, READ_CHUNK_RECORDS)
+        chunk = f.read(record_length * wanted)
+        count = len(chunk) // record_length
+        for record in record_struct.iter_unpack(memoryview(chunk)[:count * record_length]):
+            if record[0] != b'*':
+                yield record_index, [record[j] if j else None for j in index]
+            record_index += 1
+        if count < wanted:
+            break  # truncated file
+        remaining -= count
+
+
 class ProductCatalogGenerator:
     """Generate active product catalog from FoxPro database"""
     
-    def __init__(self, input_file: str, output_csv: str, years_active: int = 5):
+    def __init__(self, input_file: str, output_csv: Optional[str], years_active: int = 5):
         self.input_file = input_file
         self.output_csv = output_csv
         self.years_active = years_active
         self.cutoff_date = datetime.now() - timedelta(days=years_active * 365)
         
+        # First USRDAT day at/after the cutoff as a 'YYMMDD' string, so the
+        # activity check is a string compare (USRDAT years are 2000-2099)
+        first_day = self.cutoff_date.date()
+        if datetime.combine(first_day, time()) < self.cutoff_date:
+            first_day += timedelta(days=1)
+        if first_day.year < 2000:
+            self.cutoff_yymmdd = ''
+        elif first_day.year > 2099:
+            self.cutoff_yymmdd = '~'
+        else:
+            self.cutoff_yymmdd = first_day.strftime('%y%m%d')
+        
         # Statistics
         self.stats = {
             'total_records': 0,
@@ -36,9 +126,7 @@ class ProductCatalogGenerator:
         """Read DBF file header and return field definitions"""
         header = f.read(32)
         
-        num_records = struct.unpack('<I', header[4:8])[0]
-        header_length = struct.unpack('<H', header[8:10])[0]
-        record_length = struct.unpack('<H', header[10:12])[0]
+        num_records, header_length, record_length = _HDR.unpack_from(header, 4)
         
         # Read field descriptors
         f.seek(32)
@@ -51,10 +139,9 @@ class ProductCatalogGenerator:
             if field_desc[0] == 0x0D:  # End of fields
                 break
             
-            field_name = field_desc[0:11].decode('ascii').strip('\x00')
-            field_type = chr(field_desc[11])
-            field_length = field_desc[16]
-            field_decimal = field_desc[17]
+            name_bytes, type_byte, field_length, field_decimal = _FDESC.unpack_from(field_desc)
+            field_name = name_bytes.decode('ascii').strip('\x00')
+            field_type = type_byte.decode('latin-1')
             
             field_positions[field_name] = (current_pos, field_length, field_type)
             current_pos += field_length
@@ -68,7 +155,8 @@ class ProductCatalogGenerator:
         
         return num_records, header_length, record_length, fields, field_positions
     
-    def parse_usrdat(self, usrdat: str) -> Optional[datetime]:
+    @staticmethod
+    def parse_usrdat(usrdat: str) -> Optional[datetime]:
         """Parse USRDAT field (MMDDYY format) to datetime"""
         if not usrdat or len(usrdat) != 6:
             return None
@@ -85,114 +173,144 @@ class ProductCatalogGenerator:
         except (ValueError, IndexError):
             return None
     
-    def parse_field(self, record_data: bytes, field_pos: tuple) -> str:
-        """Parse a field from record data"""
-        pos, length, field_type = field_pos
-        field_data = record_data[pos:pos + length]
+    # Memoized: many products share the same USRDAT / MERETP text, and static
+    # so the cache key is just the string
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def usrdat_yymmdd(usrdat: str) -> Optional[str]:
+        """USRDAT (MMDDYY) -> sortable 'YYMMDD', or None if it is not a valid date"""
+        if len(usrdat) == 6 and usrdat.isdigit() and usrdat.isascii():
+            mmdd = usrdat[:4]
+            if mmdd not in _VALID_MMDD or (mmdd == '0229' and int(usrdat[4:]) % 4):
+                return None
+            return usrdat[4:] + mmdd
         
+        # Anything else goes through the full parser
+        parsed = ProductCatalogGenerator.parse_usrdat(usrdat)
+        return parsed.strftime('%y%m%d') if parsed else None
+    
+    @staticmethod
+    @lru_cache(maxsize=8192)
+    def parse_price(price_str: str) -> Optional[float]:
+        """MERETP text -> float, or None if it does not parse"""
+        try:
+            return float(price_str)
+        except ValueError:
+            return None
+    
+    def parse_field(self, field_data: bytes, field_type: str) -> str:
+        """Parse a field's raw bytes (stripped as bytes, then decoded)"""
         if field_type == 'C':  # Character
-            return field_data.decode('latin-1', errors='ignore').strip()
+            return field_data.strip(_WHITESPACE).decode('latin-1')
         elif field_type == 'N':  # Numeric
-            value = field_data.decode('ascii', errors='ignore').strip()
+            if field_data.isascii():
+                value = field_data.strip(_WHITESPACE).decode('ascii')
+            else:
+                # Dropping stray high bytes can expose spaces: decode first
+                value = field_data.decode('ascii', errors='ignore').strip()
             return value if value else '0'
         else:
-            return field_data.decode('latin-1', errors='ignore').strip()
+            return field_data.strip(_WHITESPACE).decode('latin-1')
     
-    def is_active_product(self, record: Dict[str, str]) -> bool:
+    def is_active_product(self, usrdat_str: str, price_str: str, description: str) -> bool:
         """
         Determine if a product is active based on multiple criteria
         Returns: (is_active, reason)
         """
+        active = self.check_date_and_price(usrdat_str, price_str)
+        if active is None:
+            active = self.check_description(description)
+        return active
+    
+    def check_date_and_price(self, usrdat_str: str, price_str: str) -> Optional[bool]:
+        """
+        USRDAT and MERETP part of is_active_product
+        Returns: True/False if decided, None if the description still needs checking
+        """
+        stats = self.stats
+        
         # Parse USRDAT
-        usrdat_str = record.get('USRDAT', '').strip()
+        usrdat_str = usrdat_str.strip()
         
         if not usrdat_str:
-            self.stats['no_date_records'] += 1
+            stats['no_date_records'] += 1
             # Products with no date - include them (could be legacy data)
             return True
         
-        usrdat = self.parse_usrdat(usrdat_str)
+        usrdat = self.usrdat_yymmdd(usrdat_str)
         
         if not usrdat:
-            self.stats['no_date_records'] += 1
+            stats['no_date_records'] += 1
             return True  # Invalid date - include to be safe
         
         # Primary filter: Check if updated within specified years
-        if usrdat < self.cutoff_date:
-            self.stats['inactive_records'] += 1
+        if usrdat < self.cutoff_yymmdd:
+            stats['inactive_records'] += 1
             return False
         
-        # Quality checks
-        try:
-            price = float(record.get('MERETP', '0'))
-            
-            # Filter out extreme prices (likely data errors)
-            if price > 50000:
-                self.stats['price_filtered'] += 1
-                return False
-            
-            # Filter out zero prices
-            if price <= 0:
-                self.stats['price_filtered'] += 1
-                return False
-                
-        except ValueError:
-            self.stats['price_filtered'] += 1
+        # Quality checks: unparseable, extreme (likely data errors) or zero
+        # prices, all counted together in one test
+        price = self.parse_price(price_str)
+        if price is None or price > MAX_PRICE or price <= 0:
+            stats['price_filtered'] += 1
             return False
         
-        # Check for description
-        if not record.get('MEDESC', '').strip():
+        return None
+    
+    def check_description(self, description: str) -> bool:
+        """Last is_active_product check: the product needs a description"""
+        if not description.strip():
             return False
         
         # Passed all checks
         self.stats['active_records'] += 1
         return True
     
-    def extract_product_info(self, record: Dict[str, str]) -> Dict[str, str]:
-        """Extract relevant fields for catalog"""
+    def extract_product_info(self, usrdat: str, price: str, description: str, mean13: str,
+                             barcd1: str, merkey: str, surkey: str) -> tuple:
+        """
+        Extract relevant fields for catalog (arguments in CATALOG_FIELDS order)
+        Returns: one output row in CATALOG_COLUMNS order
+        """
         
         # Parse description to separate brand, name, size
-        description = record.get('MEDESC', '').strip()
+        description = description.strip()
         
         # Get barcode - prefer MEAN13, fallback to BARCD1
-        barcode = record.get('MEAN13', '').strip()
+        barcode = mean13.strip()
         if not barcode:
-            barcode = record.get('BARCD1', '').strip()
+            barcode = barcd1.strip()
         
         # Format barcode with asterisks if exists (like Nielsen automation)
         if barcode:
             barcode = f"*{barcode}*"
         
         # Build catalog record
-        catalog_record = {
-            'Brand': '',  # Could extract from MEBRAC or supplier
-            'Name': description,
-            'Description': description,
-            'Size': '',  # Could extract from description parsing
-            'Price': record.get('MERETP', '0'),
-            'Photo': '',  # Will be populated by image upload script
-            'Cards': '',  # Not sure what this field is for
-            'Search': '',  # Could be auto-generated
-            'MERKEY': record.get('MERKEY', ''),
-            'MEDESC': description,
-            'PRICEJP': record.get('MERETP', '0'),  # Same as Price?
-            'Barcode': barcode,
-            'SURKEY': record.get('SURKEY', ''),  # Supplier key
-            'USRDAT': record.get('USRDAT', ''),  # Keep for reference
-        }
-        
-        return catalog_record
+        return (
+            '',           # Brand - could extract from MEBRAC or supplier
+            description,  # Name
+            description,  # Description
+            '',           # Size - could extract from description parsing
+            price,        # Price
+            '',           # Photo - will be populated by image upload script
+            '',           # Cards - not sure what this field is for
+            '',           # Search - could be auto-generated
+            merkey,       # MERKEY
+            description,  # MEDESC
+            price,        # PRICEJP - same as Price?
+            barcode,      # Barcode
+            surkey,       # SURKEY - supplier key
+            usrdat,       # USRDAT - keep for reference
+        )
     
-    def process_database(self):
-        """Main processing function"""
-        print(f"=" * 100)
-        print(f"ANSON SUPERMART CATALOG GENERATOR")
-        print(f"=" * 100)
-        print(f"Input file: {self.input_file}")
-        print(f"Output file: {self.output_csv}")
-        print(f"Activity filter: Last {self.years_active} years (since {self.cutoff_date.strftime('%Y-%m-%d')})")
-        print()
+    def iter_active_rows(self):
+        """
+        Yield the catalog row (CATALOG_COLUMNS order) of every active product
+        in input_file, updating self.stats as records are read.
         
+        process_database writes these rows to output_csv; other scripts can
+        use them in-process without going through a CSV file.
+        """
         with open(self.input_file, 'rb') as f:
             # Read header
             num_records, header_length, record_length, fields, field_positions = self.read_dbf_header(f)
@@ -201,53 +319,82 @@ class ProductCatalogGenerator:
             print(f"Processing...")
             print()
             
-            # Position to first record
-            f.seek(header_length)
-            
-            # Open output CSV
-            catalog_records = []
+            # (type, default) of each catalog field, split by the stage that
+            # parses it; a field missing from the file reads as its old dict
+            # default ('0' for MERETP). Built once, outside the record loop.
+            specs = tuple((field_positions[name][2] if name in field_positions else None,
+                           '0' if name == 'MERETP' else '')
+                          for name in CATALOG_FIELDS)
+            date_price_specs = specs[:2]
+            description_type, description_default = specs[2]
+            rest_specs = specs[3:]
+            parse_field = self.parse_field
+            check_date_and_price = self.check_date_and_price
+            check_description = self.check_description
+            extract_product_info = self.extract_product_info
+            show_progress = sys.stdout.isatty()
+            total_records = 0
             
-            # Process all records
-            for i in range(num_records):
-                record_data = f.read(record_length)
-                
-                if not record_data or len(record_data) < record_length:
-                    break
-                
-                # Skip deleted records
-                if record_data[0] == 0x2A:
-                    continue
+            # Process all live records (deleted ones are skipped by the reader)
+            for i, raw_values in iter_dbf_records(f, num_records, header_length, record_length,
+                                                  field_positions, CATALOG_FIELDS):
+                total_records += 1
                 
-                self.stats['total_records'] += 1
+                # Fields stay raw bytes until they are needed: USRDAT and
+                # MERETP for the date/price checks, MEDESC only if those
+                # pass, the rest only for records that are exported
+                values = [parse_field(data, field_type) if data is not None else default
+                          for data, (field_type, default) in zip(raw_values, date_price_specs)]
                 
-                # Parse all fields
-                record = {}
-                for field_name, field_pos in field_positions.items():
-                    record[field_name] = self.parse_field(record_data, field_pos)
+                # Check if active (USRDAT, MERETP, then MEDESC)
+                active = check_date_and_price(values[0], values[1])
+                if active is not False:  # MEDESC is needed from here on
+                    data = raw_values[2]
+                    values.append(parse_field(data, description_type) if data is not None
+                                  else description_default)
+                    if active is None:
+                        active = check_description(values[2])
                 
-                # Check if active
-                if self.is_active_product(record):
-                    catalog_record = self.extract_product_info(record)
-                    catalog_records.append(catalog_record)
+                if active:
+                    values += [parse_field(data, field_type) if data is not None else default
+                               for data, (field_type, default) in zip(raw_values[3:], rest_specs)]
+                    yield extract_product_info(*values)
                 
                 # Progress indicator
-                if (i + 1) % 1000 == 0:
+                if show_progress and (i + 1) & PROGRESS_MASK == 0:
                     print(f"Processed {i + 1:,} / {num_records:,} records...", end='\r')
             
+            self.stats['total_records'] += total_records
             print()  # New line after progress
-            
-            # Write to CSV
-            if catalog_records:
-                fieldnames = list(catalog_records[0].keys())
-                
-                with open(self.output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writeheader()
-                    writer.writerows(catalog_records)
-                
-                print(f"\n✓ Successfully wrote {len(catalog_records):,} active products to {self.output_csv}")
-            else:
-                print("\n✗ No active products found!")
+    
+    def process_database(self):
+        """Main processing function"""
+        print(f"=" * 100)
+        print(f"ANSON SUPERMART CATALOG GENERATOR")
+        print(f"=" * 100)
+        print(f"Input file: {self.input_file}")
+        print(f"Output file: {self.output_csv}")
+        print(f"Activity filter: Last {self.years_active} years (since {self.cutoff_date.strftime('%Y-%m-%d')})")
+        print()
+        
+        # Active rows are streamed to the CSV as they pass the filter; the
+        # file is only created once there is a row to write
+        exported = 0
+        with ExitStack() as output:
+            writer = None
+            for row in self.iter_active_rows():
+                if writer is None:
+                    csvfile = output.enter_context(
+                        open(self.output_csv, 'w', newline='', encoding='utf-8', buffering=1 << 20))
+                    writer = csv.writer(csvfile)
+                    writer.writerow(CATALOG_COLUMNS)
+                writer.writerow(row)
+                exported += 1
+        
+        if exported:
+            print(f"\n✓ Successfully wrote {exported:,} active products to {self.output_csv}")
+        else:
+            print("\n✗ No active products found!")
         
         # Print statistics
         self.print_statistics()
@@ -273,7 +420,12 @@ def main():
     """Main entry point"""
     import argparse
     
-    parser = argparse.ArgumentParser(description='Generate active product catalog from MP_MER.FPB')
+    parser = argparse.ArgumentParser(
+        description='Generate active product catalog from MP_MER.FPB',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="PyPy: only the standard library is used, so the script also runs\n"
+               "unchanged on PyPy 3.10+, whose JIT speeds up the DBF record loops:\n"
+               "  pypy3 generate_active_catalog.py MP_MER.FPB -o active_catalog.csv")
     parser.add_argument('input_file', help='Path to MP_MER.FPB file')
     parser.add_argument('-o', '--output', default='active_catalog.csv', help='Output CSV file')
     parser.add_argument('-y', '--years', type=int, default=5, help='Number of years to consider active (default: 5)')
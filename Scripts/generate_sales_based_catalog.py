@@ -8,11 +8,161 @@ Most accurate method for catalog filtering
 import struct
 import csv
 import glob
+import multiprocessing
+import os
+import sys
 from collections import Counter
+from contextlib import ExitStack
 from datetime import datetime
 from pathlib import Path
 
 
+# MP_MER.FPB fields copied into the catalog; the rest of each record is never parsed
+PRODUCT_FIELDS = ('MERKEY', 'MEDESC', 'MERETP', 'MEAN13', 'BARCD1', 'SURKEY', 'USRDAT')
+
+# DBF header: record count, header length, record length (bytes 4-11)
+_HDR = struct.Struct('<IHH')
+
+# DBF field descriptor: name, type, (4 reserved), length, decimal count
+_FDESC = struct.Struct('<11sc4xBB')
+
+# TRETYP of a retail sale, as raw field bytes
+RETAIL_TRETYP = b'RE'
+
+# Catalog columns built from an FPB product database (same as generate_active_catalog.py)
+CATALOG_COLUMNS = ('Brand', 'Name', 'Description', 'Size', 'Price', 'Photo', 'Cards', 'Search',
+                   'MERKEY', 'MEDESC', 'PRICEJP', 'Barcode', 'SURKEY', 'USRDAT')
+
+# Progress line every 16,384 records (power of two -> bitmask test), and only
+# when stdout is a terminal; redirected/cron output skips it entirely
+PROGRESS_MASK = 0x3FFF
+
+# Records per read() call when scanning the record region
+READ_CHUNK_RECORDS = 4096
+
+# Bytes that str.strip() removes from latin-1 text: stripping these from the
+# raw field and then decoding gives the same string as decode-then-strip
+_WHITESPACE = bytes(b for b in range(256) if chr(b).isspace())
+
+
+def iter_dbf_records(f, num_records: int, header_length: int, record_length: int,
+                     field_positions: dict, names: tuple):
+    """
+    Yield (record_index, raw_values) for every live record, raw_values holding
+    the bytes of each field in `names` (None if the file has no such field).
+    
+    The record region is read in chunks and split with a struct layout that
+    covers only the requested fields ('x' padding elsewhere), so per-record
+    slicing happens in C. Deleted records are skipped; record_index still
+    counts them, matching the file position.
+    """
+    present = sorted({name for name in names if name in field_positions},
+                     key=lambda name: field_positions[name][0])
+    
+    fmt = '<c'  # deletion flag
+    position = 1
+    for name in present:
+        pos, length = field_positions[name][:2]
+        if pos > position:
+            fmt += f'{pos - position}x'
+        fmt += f'{length}s'
+        position = pos + length
+    if record_length > position:
+        fmt += f'{record_length - position}x'
+    record_struct = struct.Struct(fmt)
+    
+    # Unpacked tuple index for each requested name (0 -> not in file)
+    index = [present.index(name) + 1 if name in field_positions else 0 for name in names]
+    
+    f.seek(header_length)
+    record_index = 0
+    remaining = num_records
+    while remaining > 0:
+        wanted = min(remaining, READ_CHUNK_RECORDS)
+        chunk = f.read(record_length * wanted)
+        count = len(chunk) // record_length
+        for record in record_struct.iter_unpack(memoryview(chunk)[:count * record_length]):
+            if record[0] != b'*':
+                yield record_index, [record[j] if j else None for j in index]
+            record_index += 1
+        if count < wanted:
+            break  # truncated file
+        remaining -= count
+
+
+def scan_sales_file(filename: str):
+    """
+    Count retail (TRETYP='RE') transactions per MERKEY in one TM_*.FPB file.
+    Returns: (Counter of MERKEY -> transactions, live records, retail records)
+    
+    Module-level so multiprocessing workers can run it.
+    """
+    file_counts = Counter()
+    file_retail = 0
+    file_total = 0
+    
+    with open(filename, 'rb') as f:
+        # Read header
+        header = f.read(32)
+        num_records, header_length, record_length = _HDR.unpack_from(header, 4)
+        
+        # Find field positions
+        f.seek(32)
+        field_positions = {}
+        current_pos = 1
+        
+        while True:
+            field_desc = f.read(32)
+            if field_desc[0] == 0x0D:
+                break
+            
+            name_bytes, _, field_length, _ = _FDESC.unpack_from(field_desc)
+            field_name = name_bytes.decode('ascii').strip('\x00')
+            
+            field_positions[field_name] = (current_pos, field_length)
+            current_pos += field_length
+        
+        for required in ('MERKEY', 'TRETYP'):
+            if required not in field_positions:
+                raise KeyError(required)
+        
+        # Read live transactions in bulk (deleted ones are skipped by the
+        # reader) and tally raw (TRETYP, MERKEY) byte pairs in C; each
+        # distinct pair is then decoded and checked once, not per transaction
+        pair_counts = Counter(
+            (raw_tretyp, raw_merkey)
+            for i, (raw_merkey, raw_tretyp) in iter_dbf_records(f, num_records, header_length, record_length,
+                                                                field_positions, ('MERKEY', 'TRETYP'))
+        )
+    
+    for (raw_tretyp, raw_merkey), count in pair_counts.items():
+        file_total += count
+        
+        # Check transaction type: exact bytes for the usual 2-byte field,
+        # decoded/stripped text only for padded or wider layouts
+        if raw_tretyp == RETAIL_TRETYP or raw_tretyp.decode('ascii', errors='ignore').strip() == 'RE':  # Retail sales
+            merkey = raw_merkey.decode('ascii', errors='ignore').strip()
+            
+            if merkey:
+                file_counts[merkey] += count
+                file_retail += count
+    
+    return file_counts, file_total, file_retail
+
+
+def decode_field(data: bytes, encoding: str) -> str:
+    """
+    Field bytes -> stripped text, same as data.decode(encoding, errors='ignore').strip()
+    
+    Strips the bytes first so only the unpadded value is decoded. latin-1 maps
+    every byte, so that always holds; ASCII fields with stray high bytes take
+    the decode-then-strip path, since dropping those bytes can expose spaces.
+    """
+    if encoding == 'latin-1' or data.isascii():
+        return data.strip(_WHITESPACE).decode(encoding)
+    return data.decode(encoding, errors='ignore').strip()
+
+
 class SalesBasedCatalogGenerator:
     """Generate catalog based on actual sales transactions"""
     
@@ -46,7 +196,6 @@ class SalesBasedCatalogGenerator:
         print("=" * 100)
         print()
         
-        active_merkeys = set()
         transaction_counts = Counter()
         
         sales_files = sorted(glob.glob(self.sales_pattern))
@@ -55,73 +204,30 @@ class SalesBasedCatalogGenerator:
             print(f"✗ No sales files found matching pattern: {self.sales_pattern}")
             return None, None
         
-        for filename in sales_files:
-            print(f"Processing {Path(filename).name}...", end=' ')
+        # Files are independent, so several are scanned in parallel worker
+        # processes; imap keeps results (and the printed lines) in file order
+        with ExitStack() as workers:
+            if len(sales_files) > 1:
+                pool = workers.enter_context(
+                    multiprocessing.Pool(min(len(sales_files), os.cpu_count() or 1)))
+                results = pool.imap(scan_sales_file, sales_files)
+            else:
+                results = map(scan_sales_file, sales_files)
             
-            with open(filename, 'rb') as f:
-                # Read header
-                header = f.read(32)
-                num_records = struct.unpack('<I', header[4:8])[0]
-                header_length = struct.unpack('<H', header[8:10])[0]
-                record_length = struct.unpack('<H', header[10:12])[0]
-                
-                # Find field positions
-                f.seek(32)
-                field_positions = {}
-                current_pos = 1
-                
-                while True:
-                    field_desc = f.read(32)
-                    if field_desc[0] == 0x0D:
-                        break
-                    
-                    field_name = field_desc[0:11].decode('ascii').strip('\x00')
-                    field_length = field_desc[16]
-                    
-                    field_positions[field_name] = (current_pos, field_length)
-                    current_pos += field_length
-                
-                merkey_pos, merkey_len = field_positions['MERKEY']
-                tretyp_pos, tretyp_len = field_positions['TRETYP']
-                
-                # Read transactions
-                f.seek(header_length)
-                
-                file_retail = 0
-                file_total = 0
-                
-                for i in range(num_records):
-                    record_data = f.read(record_length)
-                    
-                    if not record_data or len(record_data) < record_length:
-                        break
-                    
-                    if record_data[0] == 0x2A:  # Deleted
-                        continue
-                    
-                    file_total += 1
-                    
-                    # Check transaction type
-                    tretyp = record_data[tretyp_pos:tretyp_pos + tretyp_len].decode('ascii', errors='ignore').strip()
-                    
-                    if tretyp == 'RE':  # Retail sales
-                        merkey = record_data[merkey_pos:merkey_pos + merkey_len].decode('ascii', errors='ignore').strip()
-                        
-                        if merkey:
-                            active_merkeys.add(merkey)
-                            transaction_counts[merkey] += 1
-                            file_retail += 1
+            for filename, (file_counts, file_total, file_retail) in zip(sales_files, results):
+                transaction_counts.update(file_counts)
                 
                 self.stats['total_transactions'] += file_total
                 self.stats['retail_transactions'] += file_retail
+                self.stats['sales_files'] += 1
                 
-                print(f"{file_retail:,} retail transactions")
-            
-            self.stats['sales_files'] += 1
+                print(f"Processing {Path(filename).name}... {file_retail:,} retail transactions")
+        
+        active_merkeys = frozenset(transaction_counts)
         
         # Filter by minimum transaction count
         if self.min_transactions > 1:
-            filtered_merkeys = {m for m in active_merkeys if transaction_counts[m] >= self.min_transactions}
+            filtered_merkeys = frozenset(m for m in active_merkeys if transaction_counts[m] >= self.min_transactions)
             print(f"\n✓ Filtered to products with {self.min_transactions}+ transactions: {len(filtered_merkeys):,} products")
             active_merkeys = filtered_merkeys
         
@@ -129,36 +235,61 @@ class SalesBasedCatalogGenerator:
         
         return active_merkeys, transaction_counts
     
-    def read_product_database(self):
-        """Read product master database (MP_MER.FPB or CSV)"""
+    def read_product_database(self, active_merkeys=None):
+        """
+        Read product master database (MP_MER.FPB or CSV)
+        
+        Only products in active_merkeys (all, if None) get a catalog row
+        built; the rest are just counted for the statistics. Rows are stored
+        column-wise: one list per column, all indexed by the row number that
+        merkey_to_idx gives for a MERKEY.
+        Returns: (columns, merkey_to_idx, column_values)
+        """
         print()
         print("=" * 100)
         print("STEP 2: READING PRODUCT DATABASE")
         print("=" * 100)
         print()
         
-        products = {}
+        merkey_to_idx = {}
+        column_values = ()
+        known_merkeys = set()
+        
+        def add_row(merkey, row):
+            # A repeated MERKEY replaces its earlier row (last one wins)
+            idx = merkey_to_idx.get(merkey)
+            if idx is None:
+                merkey_to_idx[merkey] = len(merkey_to_idx)
+                for values, value in zip(column_values, row):
+                    values.append(value)
+            else:
+                for values, value in zip(column_values, row):
+                    values[idx] = value
         
         # Check if it's a CSV (from previous catalog generation) or FPB
         if self.product_database.endswith('.csv'):
             print(f"Reading CSV: {self.product_database}")
             with open(self.product_database, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
+                columns = tuple(dict.fromkeys(reader.fieldnames or ()))
+                column_values = tuple([] for _ in columns)
                 for row in reader:
                     merkey = row.get('MERKEY', '').strip()
                     if merkey:
-                        products[merkey] = row
+                        known_merkeys.add(merkey)
+                        if active_merkeys is None or merkey in active_merkeys:
+                            add_row(merkey, [row.get(column) for column in columns])
         
         else:
             # Read from FPB file
             print(f"Reading FPB: {self.product_database}")
+            columns = CATALOG_COLUMNS
+            column_values = tuple([] for _ in columns)
             
             with open(self.product_database, 'rb') as f:
                 # Read header
                 header = f.read(32)
-                num_records = struct.unpack('<I', header[4:8])[0]
-                header_length = struct.unpack('<H', header[8:10])[0]
-                record_length = struct.unpack('<H', header[10:12])[0]
+                num_records, header_length, record_length = _HDR.unpack_from(header, 4)
                 
                 # Read field descriptors
                 f.seek(32)
@@ -171,74 +302,88 @@ class SalesBasedCatalogGenerator:
                     if field_desc[0] == 0x0D:
                         break
                     
-                    field_name = field_desc[0:11].decode('ascii').strip('\x00')
-                    field_length = field_desc[16]
-                    field_type = chr(field_desc[11])
+                    name_bytes, type_byte, field_length, _ = _FDESC.unpack_from(field_desc)
+                    field_name = name_bytes.decode('ascii').strip('\x00')
+                    field_type = type_byte.decode('latin-1')
                     
                     field_positions[field_name] = (current_pos, field_length, field_type)
                     current_pos += field_length
                 
-                # Read all records
-                f.seek(header_length)
+                # Numeric fields decode as ASCII, everything else as latin-1
+                encodings = {name: 'ascii' if ftype == 'N' else 'latin-1'
+                             for name, (pos, length, ftype) in field_positions.items()}
+                
+                show_progress = sys.stdout.isatty()
                 
-                for i in range(num_records):
-                    record_data = f.read(record_length)
+                # Read live records, parsing only the fields the catalog uses.
+                # MERKEY (first in PRODUCT_FIELDS) is matched first; the other
+                # fields are only decoded for products that sold.
+                merkey_encoding = encodings.get('MERKEY')
+                value_fields = tuple((name, encodings.get(name)) for name in PRODUCT_FIELDS[1:])
+                if merkey_encoding == 'latin-1':
+                    # Character MERKEY: stripped bytes map one-to-one onto the
+                    # decoded text, so records are matched (and counted) as
+                    # raw bytes against the sold MERKEYs encoded once
+                    def merkey_key(raw):
+                        return raw.strip(_WHITESPACE)
                     
-                    if not record_data or len(record_data) < record_length:
-                        break
+                    active_keys = (None if active_merkeys is None
+                                   else frozenset(m.encode('latin-1') for m in active_merkeys))
+                else:
+                    def merkey_key(raw):
+                        return decode_field(raw, merkey_encoding)
                     
-                    if record_data[0] == 0x2A:  # Deleted
-                        continue
+                    active_keys = active_merkeys
+                
+                for i, raw_values in iter_dbf_records(f, num_records, header_length, record_length,
+                                                      field_positions, PRODUCT_FIELDS):
+                    raw_merkey = raw_values[0]
+                    key = merkey_key(raw_merkey) if raw_merkey is not None else None
+                    if key:
+                        known_merkeys.add(key)
                     
-                    # Parse record
-                    record = {}
-                    for field_name, (pos, length, ftype) in field_positions.items():
-                        field_data = record_data[pos:pos + length]
-                        
-                        if ftype == 'C':
-                            value = field_data.decode('latin-1', errors='ignore').strip()
-                        elif ftype == 'N':
-                            value = field_data.decode('ascii', errors='ignore').strip()
-                        else:
-                            value = field_data.decode('latin-1', errors='ignore').strip()
+                    if key and (active_keys is None or key in active_keys):
+                        merkey = decode_field(raw_merkey, merkey_encoding)
+                        record = {}
+                        for (field_name, encoding), field_data in zip(value_fields, raw_values[1:]):
+                            if field_data is not None:
+                                record[field_name] = decode_field(field_data, encoding)
                         
-                        record[field_name] = value
-                    
-                    merkey = record.get('MERKEY', '').strip()
-                    if merkey:
                         # Format for catalog
-                        barcode = record.get('MEAN13', '').strip()
+                        barcode = record.get('MEAN13', '')
                         if not barcode:
-                            barcode = record.get('BARCD1', '').strip()
+                            barcode = record.get('BARCD1', '')
                         if barcode:
                             barcode = f"*{barcode}*"
                         
-                        products[merkey] = {
-                            'Brand': '',
-                            'Name': record.get('MEDESC', ''),
-                            'Description': record.get('MEDESC', ''),
-                            'Size': '',
-                            'Price': record.get('MERETP', '0'),
-                            'Photo': '',
-                            'Cards': '',
-                            'Search': '',
-                            'MERKEY': merkey,
-                            'MEDESC': record.get('MEDESC', ''),
-                            'PRICEJP': record.get('MERETP', '0'),
-                            'Barcode': barcode,
-                            'SURKEY': record.get('SURKEY', ''),
-                            'USRDAT': record.get('USRDAT', ''),
-                        }
+                        description = record.get('MEDESC', '')
+                        price = record.get('MERETP', '0')
+                        add_row(merkey, (
+                            '',                          # Brand
+                            description,                 # Name
+                            description,                 # Description
+                            '',                          # Size
+                            price,                       # Price
+                            '',                          # Photo
+                            '',                          # Cards
+                            '',                          # Search
+                            merkey,                      # MERKEY
+                            description,                 # MEDESC
+                            price,                       # PRICEJP
+                            barcode,                     # Barcode
+                            record.get('SURKEY', ''),    # SURKEY
+                            record.get('USRDAT', ''),    # USRDAT
+                        ))
                     
-                    if (i + 1) % 5000 == 0:
+                    if show_progress and (i + 1) & PROGRESS_MASK == 0:
                         print(f"Processed {i + 1:,} / {num_records:,} records...", end='\r')
                 
                 print()
         
-        self.stats['products_in_catalog'] = len(products)
-        print(f"✓ Loaded {len(products):,} products from database")
+        self.stats['products_in_catalog'] = len(known_merkeys)
+        print(f"✓ Loaded {len(known_merkeys):,} products from database")
         
-        return products
+        return columns, merkey_to_idx, column_values
     
     def generate_catalog(self):
         """Main generation function"""
@@ -259,7 +404,7 @@ class SalesBasedCatalogGenerator:
             return
         
         # Step 2: Read product database
-        all_products = self.read_product_database()
+        columns, merkey_to_idx, column_values = self.read_product_database(active_merkeys)
         
         # Step 3: Generate catalog
         print()
@@ -268,33 +413,46 @@ class SalesBasedCatalogGenerator:
         print("=" * 100)
         print()
         
-        catalog_products = []
-        missing_products = []
+        # Transaction count goes in its own column (or replaces the one a
+        # previously generated catalog already has)
+        if 'TransactionCount' not in columns:
+            columns += ('TransactionCount',)
+        tc_index = columns.index('TransactionCount')
         
-        for merkey in active_merkeys:
-            if merkey in all_products:
-                product = all_products[merkey].copy()
-                # Add transaction count for reference
-                product['TransactionCount'] = transaction_counts.get(merkey, 0)
-                catalog_products.append(product)
-            else:
-                missing_products.append(merkey)
+        missing_products = []
+        exported = 0
         
-        # Sort by transaction count (most popular first)
-        catalog_products.sort(key=lambda x: x.get('TransactionCount', 0), reverse=True)
+        # Rank the keys by transaction count (most popular first) up front so
+        # rows stream straight to the CSV instead of being collected and
+        # sorted; the file is only created once there is a row to write.
+        # most_common() sorts the (merkey, count) pairs with itemgetter(1),
+        # so no Python-level key function runs per item.
+        with ExitStack() as output:
+            writer = None
+            for merkey, count in transaction_counts.most_common():
+                if count < self.min_transactions:
+                    break  # the rest were filtered out of active_merkeys
+                idx = merkey_to_idx.get(merkey)
+                if idx is not None:
+                    if writer is None:
+                        f = output.enter_context(
+                            open(self.output_csv, 'w', newline='', encoding='utf-8', buffering=1 << 20))
+                        writer = csv.writer(f)
+                        writer.writerow(columns)
+                    # Add transaction count for reference
+                    # (slice assignment: replaces the column, or appends it
+                    # when tc_index is one past the stored columns)
+                    row = [values[idx] for values in column_values]
+                    row[tc_index:tc_index + 1] = (count,)
+                    writer.writerow(row)
+                    exported += 1
+                else:
+                    missing_products.append(merkey)
         
-        # Write catalog
-        if catalog_products:
-            fieldnames = list(catalog_products[0].keys())
-            
-            with open(self.output_csv, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(catalog_products)
+        if exported:
+            self.stats['products_exported'] = exported
             
-            self.stats['products_exported'] = len(catalog_products)
-            
-            print(f"✓ Generated catalog with {len(catalog_products):,} products")
+            print(f"✓ Generated catalog with {exported:,} products")
             
             if missing_products:
                 print(f"⚠️  Warning: {len(missing_products):,} products sold but not in database")
@@ -324,15 +482,27 @@ class SalesBasedCatalogGenerator:
         print("SALES VELOCITY DISTRIBUTION")
         print("=" * 100)
         
-        velocity_buckets = {
-            '100+ transactions': sum(1 for c in transaction_counts.values() if c >= 100),
-            '50-99 transactions': sum(1 for c in transaction_counts.values() if 50 <= c < 100),
-            '20-49 transactions': sum(1 for c in transaction_counts.values() if 20 <= c < 50),
-            '10-19 transactions': sum(1 for c in transaction_counts.values() if 10 <= c < 20),
-            '5-9 transactions': sum(1 for c in transaction_counts.values() if 5 <= c < 10),
-            '2-4 transactions': sum(1 for c in transaction_counts.values() if 2 <= c < 5),
-            '1 transaction': sum(1 for c in transaction_counts.values() if c == 1),
-        }
+        velocity_buckets = dict.fromkeys(('100+ transactions', '50-99 transactions', '20-49 transactions',
+                                          '10-19 transactions', '5-9 transactions', '2-4 transactions',
+                                          '1 transaction'), 0)
+        
+        # One pass: tally how many products share each count (in C), then
+        # bucket the distinct counts
+        for c, products in Counter(transaction_counts.values()).items():
+            if c >= 100:
+                velocity_buckets['100+ transactions'] += products
+            elif c >= 50:
+                velocity_buckets['50-99 transactions'] += products
+            elif c >= 20:
+                velocity_buckets['20-49 transactions'] += products
+            elif c >= 10:
+                velocity_buckets['10-19 transactions'] += products
+            elif c >= 5:
+                velocity_buckets['5-9 transactions'] += products
+            elif c >= 2:
+                velocity_buckets['2-4 transactions'] += products
+            elif c == 1:
+                velocity_buckets['1 transaction'] += products
         
         for bucket, count in velocity_buckets.items():
             pct = count / len(transaction_counts) * 100 if transaction_counts else 0
@@ -342,11 +512,40 @@ class SalesBasedCatalogGenerator:
         print("=" * 100)
 
 
+def generate_catalog(sales_pattern: str, product_db: str, output: str,
+                     min_transactions: int = 1) -> int:
+    """
+    Build the sales-based catalog in-process.
+    
+    Used by main() and by deploy_catalog.py, so callers that already have the
+    interpreter running do not need to spawn this script. Returns 0 like the
+    command-line exit status.
+    """
+    generator = SalesBasedCatalogGenerator(
+        sales_pattern=sales_pattern,
+        product_database=product_db,
+        output_csv=output,
+        min_transactions=min_transactions
+    )
+    
+    generator.generate_catalog()
+    
+    print(f"\n✓ Sales-based catalog generation complete!")
+    print(f"✓ Output: {output}")
+    print(f"\n💡 This catalog contains only products that actually sold in the specified period.")
+    return 0
+
+
 def main():
     """Main entry point"""
     import argparse
     
-    parser = argparse.ArgumentParser(description='Generate catalog from sales transactions')
+    parser = argparse.ArgumentParser(
+        description='Generate catalog from sales transactions',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="PyPy: only the standard library is used, so the script also runs\n"
+               "unchanged on PyPy 3.10+, whose JIT speeds up the DBF record loops:\n"
+               "  pypy3 generate_sales_based_catalog.py 'TM_*.FPB' MP_MER.FPB -o SALES_BASED_CATALOG.csv")
     parser.add_argument('sales_pattern', help='Pattern for sales files (e.g., TM_*.FPB)')
     parser.add_argument('product_db', help='Product database (MP_MER.FPB or ANSON_ACTIVE_CATALOG.csv)')
     parser.add_argument('-o', '--output', default='SALES_BASED_CATALOG.csv', help='Output CSV file')
@@ -355,20 +554,9 @@ def main():
     
     args = parser.parse_args()
     
-    # Create generator
-    generator = SalesBasedCatalogGenerator(
-        sales_pattern=args.sales_pattern,
-        product_database=args.product_db,
-        output_csv=args.output,
-        min_transactions=args.min_transactions
-    )
-    
-    generator.generate_catalog()
-    
-    print(f"\n✓ Sales-based catalog generation complete!")
-    print(f"✓ Output: {args.output}")
-    print(f"\n💡 This catalog contains only products that actually sold in the specified period.")
+    return generate_catalog(args.sales_pattern, args.product_db, args.output,
+                            args.min_transactions)
 
 
 if __name__ == '__main__':
-    main()
+    exit(main())
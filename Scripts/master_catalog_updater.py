@@ -4,80 +4,103 @@ Master Catalog Updater - Processes both MP_MER.FPB and MP_MER2.FPB
 Combines active products from both files and generates unified catalog
 """
 
-import subprocess
 import csv
+import io
+import traceback
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 
+from generate_active_catalog import CATALOG_COLUMNS, ProductCatalogGenerator
 
-def process_fpb_file(input_file: str, output_file: str, years: int = 5):
-    """Process a single FPB file"""
+# Where process_fpb_file finds the dedup key and date in a catalog row
+MERKEY_INDEX = CATALOG_COLUMNS.index('MERKEY')
+USRDAT_INDEX = CATALOG_COLUMNS.index('USRDAT')
+
+
+@lru_cache(maxsize=8192)
+def usrdat_key(usrdat: str) -> int:
+    """
+    USRDAT (MMDDYY) -> YYMMDD as an int, so a newer date compares greater
+    (0 if it is not a valid date). MMDDYY text itself does not sort by date.
+    """
+    yymmdd = ProductCatalogGenerator.usrdat_yymmdd(usrdat)
+    return int(yymmdd) if yymmdd else 0
+
+
+def process_fpb_file(input_file: str, products: dict, years: int = 5):
+    """
+    Process a single FPB file in-process, merging its active products into
+    products (MERKEY -> (usrdat_key, catalog row)) as they are generated
+    """
     print(f"\nProcessing {Path(input_file).name}...")
     print(f"-" * 100)
     
-    cmd = [
-        'python3',
-        'generate_active_catalog.py',
-        input_file,
-        '-o', output_file,
-        '-y', str(years)
-    ]
-    
-    result = subprocess.run(cmd, capture_output=False)
-    
-    if result.returncode != 0:
+    generator = ProductCatalogGenerator(input_file, None, years)
+    print(f"Activity filter: Last {years} years (since {generator.cutoff_date.strftime('%Y-%m-%d')})")
+    
+    active = 0
+    try:
+        for row in generator.iter_active_rows():
+            active += 1
+            merkey = row[MERKEY_INDEX]
+            if merkey:
+                # Keep the most recent entry (based on USRDAT)
+                date_key = usrdat_key(row[USRDAT_INDEX])
+                existing = products.get(merkey)
+                if existing is None or date_key > existing[0]:
+                    products[merkey] = (date_key, row)
+        print(f"✓ Found {active:,} active products in {Path(input_file).name}")
+        generator.print_statistics()
+    except Exception:
+        traceback.print_exc()
         print(f"✗ Error processing {input_file}")
         return False
     
     return True
 
 
-def merge_catalogs(file1: str, file2: str, output_file: str):
-    """Merge two catalog CSV files, removing duplicates based on MERKEY"""
-    print(f"\nMerging catalogs...")
+def extract_fpb_file(input_file: str, years: int = 5):
+    """
+    process_fpb_file in a worker process: returns (success, products, output),
+    with the console output captured so the parent can print it in file order
+    """
+    products = {}
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        success = process_fpb_file(input_file, products, years)
+    return success, products, output.getvalue()
+
+
+def merge_products(products: dict, file_products: dict):
+    """Merge one file's products into products, keeping the newer USRDAT (ties: earlier file)"""
+    for merkey, entry in file_products.items():
+        existing = products.get(merkey)
+        if existing is None or entry[0] > existing[0]:
+            products[merkey] = entry
+
+
+def write_catalog(products: dict, output_file: str):
+    """Write merged catalog rows (from process_fpb_file) sorted by MERKEY"""
+    print(f"\nWriting merged catalog...")
     print(f"-" * 100)
     
-    products = {}  # Use dict to deduplicate by MERKEY
-    
-    # Read both files
-    for input_file in [file1, file2]:
-        if not Path(input_file).exists():
-            print(f"Warning: {input_file} not found, skipping...")
-            continue
-        
-        with open(input_file, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                merkey = row.get('MERKEY', '')
-                if merkey:
-                    # Keep the most recent entry (based on USRDAT)
-                    if merkey not in products:
-                        products[merkey] = row
-                    else:
-                        # Compare USRDAT and keep newer
-                        existing_date = products[merkey].get('USRDAT', '')
-                        new_date = row.get('USRDAT', '')
-                        if new_date > existing_date:
-                            products[merkey] = row
-    
-    # Write merged catalog
-    if products:
-        # Get fieldnames from first product
-        fieldnames = list(next(iter(products.values())).keys())
-        
-        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            # Sort by MERKEY for consistent output
-            for merkey in sorted(products.keys()):
-                writer.writerow(products[merkey])
-        
-        print(f"✓ Merged {len(products):,} unique products into {output_file}")
-        return len(products)
-    else:
+    if not products:
         print("✗ No products to merge!")
         return 0
+    
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CATALOG_COLUMNS)
+        
+        # Sort by MERKEY for consistent output
+        writer.writerows(products[merkey][1] for merkey in sorted(products))
+    
+    print(f"✓ Merged {len(products):,} unique products into {output_file}")
+    return len(products)
 
 
 def generate_report(merged_file: str):
@@ -85,35 +108,54 @@ def generate_report(merged_file: str):
     print(f"\nGenerating summary report...")
     print(f"-" * 100)
     
-    with open(merged_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        products = list(reader)
-    
-    # Statistics
-    total_products = len(products)
-    products_with_barcode = sum(1 for p in products if p.get('Barcode'))
-    
-    # Price statistics
-    prices = []
-    for p in products:
-        try:
-            price = float(p.get('Price', 0))
-            if price > 0:
-                prices.append(price)
-        except ValueError:
-            pass
-    
-    avg_price = sum(prices) / len(prices) if prices else 0
-    min_price = min(prices) if prices else 0
-    max_price = max(prices) if prices else 0
-    
-    # Recent updates
-    recent_updates = {}
-    for p in products:
-        usrdat = p.get('USRDAT', '')
-        if len(usrdat) == 6:
-            year = '20' + usrdat[4:6]
-            recent_updates[year] = recent_updates.get(year, 0) + 1
+    # Statistics, accumulated in one streaming pass over the file
+    total_products = 0
+    products_with_barcode = 0
+    price_count = 0
+    price_sum = 0.0
+    min_price = max_price = None
+    recent_updates = Counter()
+    
+    with open(merged_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        columns = {name: i for i, name in enumerate(header)}
+        barcode_index = columns.get('Barcode')
+        price_index = columns.get('Price')
+        usrdat_index = columns.get('USRDAT')
+        
+        for row in reader:
+            if not row:
+                continue  # blank line, not a product
+            total_products += 1
+            width = len(row)
+            
+            if barcode_index is not None and barcode_index < width and row[barcode_index]:
+                products_with_barcode += 1
+            
+            # Price statistics
+            if price_index is not None and price_index < width:
+                try:
+                    price = float(row[price_index])
+                except ValueError:
+                    price = 0
+                if price > 0:
+                    price_count += 1
+                    price_sum += price
+                    if min_price is None or price < min_price:
+                        min_price = price
+                    if max_price is None or price > max_price:
+                        max_price = price
+            
+            # Recent updates
+            if usrdat_index is not None and usrdat_index < width:
+                usrdat = row[usrdat_index]
+                if len(usrdat) == 6:
+                    recent_updates['20' + usrdat[4:6]] += 1
+    
+    avg_price = price_sum / price_count if price_count else 0
+    if not price_count:
+        min_price = max_price = 0
     
     # Print report
     print(f"\n{'=' * 100}")
@@ -147,27 +189,37 @@ def main():
     MP_MER1 = '/mnt/user-data/uploads/MP_MER.FPB'
     MP_MER2 = '/mnt/user-data/uploads/MP_MER2.FPB'
     
-    OUTPUT1 = 'catalog_from_mpmer1.csv'
-    OUTPUT2 = 'catalog_from_mpmer2.csv'
     FINAL_OUTPUT = 'ANSON_ACTIVE_CATALOG.csv'
     
-    # Step 1: Process first FPB file
-    if Path(MP_MER1).exists():
-        success1 = process_fpb_file(MP_MER1, OUTPUT1, YEARS_ACTIVE)
-    else:
-        print(f"Warning: {MP_MER1} not found!")
-        success1 = False
+    # Steps 1-2: Process both FPB files at once, one worker process each
+    # (the parsing is CPU-bound, so threads would take turns on the GIL).
+    # Each returns its deduplicated products; they are merged in file order,
+    # so no per-file catalog CSV is written and read back.
+    products = {}
+    sources = (MP_MER1, MP_MER2)
+    results = []
+    
+    with ProcessPoolExecutor(max_workers=len(sources)) as executor:
+        extracts = [executor.submit(extract_fpb_file, source, YEARS_ACTIVE) if Path(source).exists() else None
+                    for source in sources]
+        
+        for source, extract in zip(sources, extracts):
+            if extract is None:
+                print(f"Warning: {source} not found!")
+                results.append(False)
+                continue
+            
+            success, file_products, output = extract.result()
+            print(output, end='')
+            if success:
+                merge_products(products, file_products)
+            results.append(success)
     
-    # Step 2: Process second FPB file
-    if Path(MP_MER2).exists():
-        success2 = process_fpb_file(MP_MER2, OUTPUT2, YEARS_ACTIVE)
-    else:
-        print(f"Warning: {MP_MER2} not found!")
-        success2 = False
+    success1, success2 = results
     
-    # Step 3: Merge catalogs
+    # Step 3: Write merged catalog
     if success1 or success2:
-        total_products = merge_catalogs(OUTPUT1, OUTPUT2, FINAL_OUTPUT)
+        total_products = write_catalog(products, FINAL_OUTPUT)
         
         # Step 4: Generate report
         if total_products > 0:
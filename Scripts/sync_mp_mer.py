@@ -14,17 +14,62 @@ Features:
 - Logs all changes for review
 """
 
+import heapq
+import mmap
+import shutil
 import struct
 import sqlite3
 import os
 import sys
+import tempfile
+from contextlib import ExitStack
 from pathlib import Path
 from datetime import datetime, date
+from functools import lru_cache
 from typing import Dict, List, Tuple
 
+# MP_MER fields the sync reads; the rest of each record is never decoded
+SYNC_FIELDS = frozenset({'MERKEY', 'MEDESC', 'MERETP', 'MEAN13', 'BARCD1', 'BARCD2', 'BARCD3', 'USRDAT'})
 
-def read_dbf_file(filepath):
-    """Read FoxPro DBF file and return records"""
+# Changes of each kind shown in the console report (all go to the change log)
+REPORT_SAMPLE_SIZE = 20
+
+# Products per executemany batch in the sync loop
+SYNC_BATCH_SIZE = 5000
+
+# Records whose product/price rows are looked up together, and the most
+# MERKEYs bound into one IN (...) list (SQLite's historic variable limit)
+LOOKUP_WINDOW = 10000
+LOOKUP_MAX_PARAMS = 999
+
+# Index the price updates rely on (also in schema.sql), created here so
+# databases built from an older schema pick it up. Partial: only current
+# prices are indexed, so the tree stays one entry per priced product.
+# (barcodes already has an index from its UNIQUE(merkey, barcode).)
+INDEX_DDL = """
+CREATE INDEX IF NOT EXISTS idx_prices_current_merkey ON prices(merkey) WHERE is_current = 1;
+"""
+
+# Trigger that retires the current price when a new one is inserted (also in
+# schema.sql), so a price change is one INSERT instead of UPDATE + INSERT
+PRICE_TRIGGER_DDL = """
+CREATE TRIGGER IF NOT EXISTS mark_old_prices_not_current
+BEFORE INSERT ON prices
+FOR EACH ROW
+WHEN NEW.is_current = 1
+BEGIN
+    UPDATE prices SET is_current = 0 WHERE merkey = NEW.merkey AND is_current = 1;
+END;
+"""
+
+
+def iter_dbf_records(filepath, needed_fields=None):
+    """
+    Read FoxPro DBF file, yielding one record dict at a time
+    
+    needed_fields: names of the fields to decode (all, if None); the others
+    are skipped as padding and left out of the record dicts
+    """
     
     with open(filepath, 'rb') as f:
         # Read header
@@ -52,42 +97,56 @@ def read_dbf_file(filepath):
             fields.append({'name': field_name, 'type': field_type, 'length': field_length})
             current_pos += field_length
         
-        # Read all records
-        f.seek(header_length)
-        records = []
+        # Every record is split in one C call: a struct layout of the
+        # deletion flag plus each needed field in file order ('x' padding
+        # over the rest)
+        for field in fields:
+            field['wanted'] = needed_fields is None or field['name'] in needed_fields
+        record_struct = struct.Struct('<c' + ''.join(
+            f"{field['length']}{'s' if field['wanted'] else 'x'}" for field in fields)
+            + f'{max(record_length - current_pos, 0)}x')
+        if record_struct.size != record_length:
+            raise ValueError(f"Field lengths do not match record length in {filepath}")
         
-        for i in range(num_records):
-            record_data = f.read(record_length)
-            
-            if not record_data or len(record_data) < record_length:
-                break
-            
-            if record_data[0] == 0x2A:  # Deleted record
-                continue
+        # Numeric and date fields decode as ASCII, everything else as latin-1
+        decoders = tuple((field['name'], 'ascii' if field['type'] in ('N', 'D') else 'latin-1')
+                         for field in fields if field['wanted'])
+        
+        # The layout is fixed once the header is read, so the record dict is
+        # built by a function generated for it: one straight-line dict
+        # display instead of a zip over the decoders for every record
+        source = 'def parse_record(values):\n    return {' + ', '.join(
+            f"{name!r}: values[{i}].decode({encoding!r}, 'ignore').strip()"
+            for i, (name, encoding) in enumerate(decoders, 1)) + '}\n'
+        namespace = {}
+        exec(source, namespace)
+        parse_record = namespace['parse_record']
+        
+        # Map the file and unpack each record in place: a sweep of record
+        # offsets over the mapped region, with the OS page cache doing the I/O
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            available = max(0, len(mm) - header_length) // record_length
+            end = header_length + min(num_records, available) * record_length  # truncated file -> stop
+            unpack_from = record_struct.unpack_from
+            read = 0
             
-            record = {}
-            for field_name, (pos, length, ftype) in field_positions.items():
-                field_data = record_data[pos:pos + length]
+            for i, offset in enumerate(range(header_length, end, record_length), 1):
+                values = unpack_from(mm, offset)
+                if values[0] == b'*':  # Deleted record
+                    continue
                 
-                if ftype == 'C':
-                    value = field_data.decode('latin-1', errors='ignore').strip()
-                elif ftype == 'N':
-                    value = field_data.decode('ascii', errors='ignore').strip()
-                elif ftype == 'D':
-                    value = field_data.decode('ascii', errors='ignore').strip()
-                else:
-                    value = field_data.decode('latin-1', errors='ignore').strip()
+                yield parse_record(values)
+                read += 1
                 
-                record[field_name] = value
-            
-            records.append(record)
-            
-            if (i + 1) % 5000 == 0:
-                print(f"  Reading {i + 1:,} / {num_records:,} records...", end='\r')
-        
-        print(f"  Read {len(records):,} records                    ")
+                if i % 5000 == 0:
+                    print(f"  Reading {i:,} / {num_records:,} records...", end='\r')
         
-    return records
+        print(f"  Read {read:,} records                    ")
+
+
+def read_dbf_file(filepath, needed_fields=None):
+    """Read FoxPro DBF file and return records"""
+    return list(iter_dbf_records(filepath, needed_fields))
 
 
 def parse_float(value):
@@ -106,9 +165,25 @@ def parse_int(value):
         return 0
 
 
+@lru_cache(maxsize=8192)
+def usrdat_key(usrdat):
+    """
+    USRDAT (MMDDYY) -> YYMMDD as an int, so a newer date compares greater
+    (0 if it is not a 6-digit date). MMDDYY text itself does not sort by date.
+    """
+    if len(usrdat) == 6 and usrdat.isdigit() and usrdat.isascii():
+        return int(usrdat[4:] + usrdat[:4])
+    return 0
+
+
 def clean_text(text):
     """Clean and normalize text"""
-    return ' '.join((text or '').strip().split())
+    text = (text or '').strip()
+    # Typical DBF text has single spaces only (every other whitespace
+    # character is non-printable), so it needs no split/join rebuild
+    if '  ' in text or not text.isprintable():
+        text = ' '.join(text.split())
+    return text
 
 
 def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None):
@@ -135,60 +210,74 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
         print(f"MP_MER2:  {mp_mer2_path}")
     print()
     
-    # Connect to database
-    conn = sqlite3.connect(db_path)
+    # Connect to database (autocommit mode: the sync's writes run in one
+    # explicit BEGIN IMMEDIATE ... COMMIT transaction)
+    conn = sqlite3.connect(db_path, isolation_level=None)
     conn.execute("PRAGMA foreign_keys = ON;")
+    # WAL + relaxed fsync for the bulk write; readers are not blocked
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")
+    conn.executescript(INDEX_DDL)
+    conn.executescript(PRICE_TRIGGER_DDL)
     cursor = conn.cursor()
     
-    # Start sync log
-    cursor.execute("""
-        INSERT INTO sync_log (sync_type, source_file, status, started_at)
-        VALUES ('MP_MER_SYNC', ?, 'IN_PROGRESS', CURRENT_TIMESTAMP)
-    """, (os.path.basename(mp_mer_path),))
-    sync_id = cursor.lastrowid
-    conn.commit()
+    # The sync_log row is written once, when the outcome is known: in the
+    # sync's own transaction on success (so it commits with the changes, or
+    # not at all), on its own after a failure. WAL keeps a crashed sync's
+    # partial writes out either way.
+    source_file = os.path.basename(mp_mer_path)
+    started_at = cursor.execute("SELECT CURRENT_TIMESTAMP").fetchone()[0]
     
-    # Track changes
+    # Track changes: counts only. Each change is written to the change log
+    # as it is found, and just the console report's samples are kept.
     changes = {
-        'new_products': [],
-        'price_changes': [],
-        'medesc_changes': [],
-        'barcode_changes': [],
-        'status_changes': [],
+        'new_products': 0,
+        'price_changes': 0,
+        'medesc_changes': 0,
         'products_processed': 0,
         'prices_updated': 0,
         'barcodes_added': 0,
     }
+    new_product_samples = []    # first REPORT_SAMPLE_SIZE
+    medesc_change_samples = []  # first REPORT_SAMPLE_SIZE
+    largest_price_changes = []  # heap of (|pct_change|, -order, change)
+    
+    # The change log is written section by section: new products go straight
+    # to the file, price and MEDESC changes to spooled temporary files that
+    # are appended once the loop is done
+    change_logs = ExitStack()
     
     try:
         # Read MP_MER
         print("=" * 80)
         print("READING MP_MER.FPB")
         print("=" * 80)
-        records = read_dbf_file(mp_mer_path)
         
         # Read MP_MER2 if provided
         if mp_mer2_path and os.path.exists(mp_mer2_path):
+            # Both files are streamed straight into the merge, so only the
+            # merged records are ever held in memory
+            merged = {}
+            for rec in iter_dbf_records(mp_mer_path, SYNC_FIELDS):
+                merkey = rec.get('MERKEY', '')
+                if merkey:
+                    merged[merkey] = rec
+            
             print()
             print("=" * 80)
             print("READING MP_MER2.FPB")
             print("=" * 80)
-            records2 = read_dbf_file(mp_mer2_path)
             
             # Merge, preferring newer data
-            merged = {}
-            for rec in records:
-                merkey = rec.get('MERKEY', '').strip()
-                if merkey:
-                    merged[merkey] = rec
-            
-            for rec in records2:
-                merkey = rec.get('MERKEY', '').strip()
+            for rec in iter_dbf_records(mp_mer2_path, SYNC_FIELDS):
+                merkey = rec.get('MERKEY', '')
                 if merkey:
                     # Prefer newer USRDAT
                     if merkey in merged:
-                        existing_date = merged[merkey].get('USRDAT', '')
-                        new_date = rec.get('USRDAT', '')
+                        existing_date = usrdat_key(merged[merkey].get('USRDAT', ''))
+                        new_date = usrdat_key(rec.get('USRDAT', ''))
                         if new_date >= existing_date:
                             merged[merkey] = rec
                     else:
@@ -196,6 +285,8 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
             
             records = list(merged.values())
             print(f"  Merged total: {len(records):,} unique products")
+        else:
+            records = read_dbf_file(mp_mer_path, SYNC_FIELDS)
         
         print()
         print("=" * 80)
@@ -203,25 +294,125 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
         print("=" * 80)
         print()
         
-        # Get existing products from database
-        cursor.execute("""
-            SELECT merkey, description, active
-            FROM products
-        """)
-        existing_products = {row[0]: {'description': row[1], 'active': row[2]} 
-                           for row in cursor.fetchall()}
+        log_file = f"sync_changes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        log_f = open(log_file, 'w', encoding='utf-8', buffering=1 << 20)
+        change_logs.callback(os.remove, log_file)  # dropped unless the sync completes
+        change_logs.callback(log_f.close)
+        price_log = change_logs.enter_context(
+            tempfile.SpooledTemporaryFile(max_size=1 << 20, mode='w+', encoding='utf-8'))
+        medesc_log = change_logs.enter_context(
+            tempfile.SpooledTemporaryFile(max_size=1 << 20, mode='w+', encoding='utf-8'))
+        
+        log_f.write("=" * 80 + "\n")
+        log_f.write("MP_MER SYNC - DETAILED CHANGE LOG\n")
+        log_f.write("=" * 80 + "\n")
+        log_f.write(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        log_f.write(f"Source: {mp_mer_path}\n")
+        log_f.write("\n")
+        log_f.write("NEW PRODUCTS\n")
+        log_f.write("-" * 80 + "\n")
+        
+        # Take the write lock up front rather than upgrading mid-batch, so
+        # the lookups and all writes see one consistent database state
+        cursor.execute("BEGIN IMMEDIATE")
+        
+        # Products and current prices are looked up a window of records at
+        # a time, so only rows for MERKEYs in the file are loaded. A MERKEY
+        # already written by this run keeps its pre-sync values, which a
+        # repeat in a later window is compared against.
+        pre_sync_products = {}  # merkey -> product (None: was new)
+        pre_sync_prices = {}    # merkey -> price_retail (None: had none)
+        
+        def lookup(window):
+            merkeys = {record.get('MERKEY', '') for record in window}
+            merkeys.discard('')
+            products = {}
+            prices = {}
+            
+            params = list(merkeys)
+            for start in range(0, len(params), LOOKUP_MAX_PARAMS):
+                chunk = params[start:start + LOOKUP_MAX_PARAMS]
+                marks = ','.join('?' * len(chunk))
+                cursor.execute(f"""
+                    SELECT merkey, description, active
+                    FROM products
+                    WHERE merkey IN ({marks})
+                """, chunk)
+                products.update((row[0], {'description': row[1], 'active': row[2]})
+                                for row in cursor)
+                cursor.execute(f"""
+                    SELECT merkey, price_retail
+                    FROM prices
+                    WHERE is_current = 1 AND merkey IN ({marks})
+                """, chunk)
+                prices.update(cursor)
+            
+            for merkey in merkeys & pre_sync_products.keys():
+                if pre_sync_products[merkey] is None:
+                    products.pop(merkey, None)
+                else:
+                    products[merkey] = pre_sync_products[merkey]
+            for merkey in merkeys & pre_sync_prices.keys():
+                if pre_sync_prices[merkey] is None:
+                    prices.pop(merkey, None)
+                else:
+                    prices[merkey] = pre_sync_prices[merkey]
+            
+            return products, prices
         
-        # Get current prices
+        # Get existing barcodes (kept up to date as barcodes are queued)
         cursor.execute("""
-            SELECT merkey, price_retail
-            FROM prices
-            WHERE is_current = 1
+            SELECT merkey, barcode
+            FROM barcodes
         """)
-        current_prices = {row[0]: row[1] for row in cursor.fetchall()}
+        existing_barcode_pairs = set(cursor.fetchall())
+        
+        # Writes are queued and run with executemany, SYNC_BATCH_SIZE
+        # products at a time, all in one transaction. A batch never holds a
+        # MERKEY twice, so running it statement type by statement type
+        # (products first, for the foreign keys) gives the same result as
+        # running each product's statements in turn.
+        new_products_batch = []   # (merkey, description)
+        desc_updates_batch = []   # (description, merkey)
+        new_prices_batch = []     # (merkey, price_retail)
+        barcode_batch = []        # (merkey, barcode, is_primary)
+        batch_merkeys = set()
+        
+        def flush():
+            cursor.executemany("""
+                INSERT INTO products (
+                    merkey, description, data_quality, needs_enrichment, active
+                ) VALUES (?, ?, 'NEEDS_DESCRIPTION', 1, 1)
+            """, new_products_batch)
+            cursor.executemany("""
+                UPDATE products SET
+                    description = ?,
+                    needs_enrichment = 1,
+                    data_quality = 'NEEDS_REVIEW',
+                    enrichment_notes = 'MEDESC changed - review for size/property changes',
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE merkey = ?
+            """, desc_updates_batch)
+            cursor.executemany("""
+                INSERT INTO prices (
+                    merkey, price_retail, effective_date, is_current
+                ) VALUES (?, ?, date('now'), 1)
+            """, new_prices_batch)
+            cursor.executemany("""
+                INSERT OR IGNORE INTO barcodes (
+                    merkey, barcode, is_primary
+                ) VALUES (?, ?, ?)
+            """, barcode_batch)
+            for batch in (new_products_batch, desc_updates_batch, new_prices_batch,
+                          barcode_batch, batch_merkeys):
+                batch.clear()
         
         # Process each record from MP_MER
         for i, record in enumerate(records, 1):
-            merkey = record.get('MERKEY', '').strip()
+            if (i - 1) % LOOKUP_WINDOW == 0:
+                existing_products, current_prices = lookup(records[i - 1:i - 1 + LOOKUP_WINDOW])
+            
+            merkey = record.get('MERKEY', '')
             if not merkey:
                 continue
             
@@ -230,41 +421,42 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
                 continue
             
             # Get price
-            price_raw = record.get('MERETP', '').strip()
+            price_raw = record.get('MERETP', '')
             price = parse_float(price_raw)
             
             if price <= 0:
                 continue  # Skip products with no price
             
+            if merkey in batch_merkeys or len(batch_merkeys) >= SYNC_BATCH_SIZE:
+                flush()
+            batch_merkeys.add(merkey)
+            
             # Get barcodes
             barcodes = []
             for bc_field in ['MEAN13', 'BARCD1', 'BARCD2', 'BARCD3']:
-                bc = record.get(bc_field, '').strip()
+                bc = record.get(bc_field, '')
                 if bc:
                     barcodes.append(bc)
             
             # Check if product exists
             if merkey not in existing_products:
                 # NEW PRODUCT
-                changes['new_products'].append({
-                    'merkey': merkey,
-                    'medesc': medesc,
-                    'price': price
-                })
+                changes['new_products'] += 1
+                log_f.write(f"{merkey}\t{medesc}\t₱{price:.2f}\n")
+                if len(new_product_samples) < REPORT_SAMPLE_SIZE:
+                    new_product_samples.append({
+                        'merkey': merkey,
+                        'medesc': medesc,
+                        'price': price
+                    })
                 
                 # Insert new product
-                cursor.execute("""
-                    INSERT INTO products (
-                        merkey, description, data_quality, needs_enrichment, active
-                    ) VALUES (?, ?, 'NEEDS_DESCRIPTION', 1, 1)
-                """, (merkey, medesc))
+                new_products_batch.append((merkey, medesc))
+                pre_sync_products.setdefault(merkey, None)
+                pre_sync_prices.setdefault(merkey, None)
                 
                 # Insert price
-                cursor.execute("""
-                    INSERT INTO prices (
-                        merkey, price_retail, effective_date, is_current
-                    ) VALUES (?, ?, date('now'), 1)
-                """, (merkey, price))
+                new_prices_batch.append((merkey, price))
                 
                 changes['prices_updated'] += 1
                 
@@ -274,32 +466,39 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
                 # 1. Check MEDESC change
                 old_desc = existing_products[merkey]['description']
                 if medesc != old_desc:
-                    changes['medesc_changes'].append({
-                        'merkey': merkey,
-                        'old_medesc': old_desc,
-                        'new_medesc': medesc,
-                        'reason': 'Possible size/property change'
-                    })
+                    changes['medesc_changes'] += 1
+                    medesc_log.write(f"{merkey}\n")
+                    medesc_log.write(f"  OLD: {old_desc}\n")
+                    medesc_log.write(f"  NEW: {medesc}\n")
+                    medesc_log.write("\n")
+                    if len(medesc_change_samples) < REPORT_SAMPLE_SIZE:
+                        medesc_change_samples.append({
+                            'merkey': merkey,
+                            'old_medesc': old_desc,
+                            'new_medesc': medesc,
+                            'reason': 'Possible size/property change'
+                        })
                     
                     # Update description and flag for review
-                    cursor.execute("""
-                        UPDATE products SET
-                            description = ?,
-                            needs_enrichment = 1,
-                            data_quality = 'NEEDS_REVIEW',
-                            enrichment_notes = 'MEDESC changed - review for size/property changes',
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE merkey = ?
-                    """, (medesc, merkey))
+                    desc_updates_batch.append((medesc, merkey))
+                    pre_sync_products.setdefault(merkey, existing_products[merkey])
                 
                 # 2. Check price change
                 if merkey in current_prices:
                     old_price = current_prices[merkey]
-                    if abs(price - old_price) > 0.01:  # Price changed
-                        price_diff = price - old_price
+                    price_diff = price - old_price
+                    # abs(price_diff) > 0.01 as two float compares (no call);
+                    # the percent is only worked out for actual changes
+                    if price_diff > 0.01 or price_diff < -0.01:  # Price changed
                         price_pct = (price_diff / old_price * 100) if old_price > 0 else 0
                         
-                        changes['price_changes'].append({
+                        price_log.write(f"{merkey}\t{medesc}\t"
+                                        f"₱{old_price:.2f} → ₱{price:.2f}\t"
+                                        f"{price_pct:+.1f}%\n")
+                        
+                        # Keep the largest changes; on a tie the earlier one
+                        # ranks first, as with a stable sort
+                        entry = (abs(price_pct), -changes['price_changes'], {
                             'merkey': merkey,
                             'medesc': medesc,
                             'old_price': old_price,
@@ -307,78 +506,76 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
                             'diff': price_diff,
                             'pct_change': price_pct
                         })
+                        if len(largest_price_changes) < REPORT_SAMPLE_SIZE:
+                            heapq.heappush(largest_price_changes, entry)
+                        else:
+                            heapq.heappushpop(largest_price_changes, entry)
+                        changes['price_changes'] += 1
                         
-                        # Mark old price as not current
-                        cursor.execute("""
-                            UPDATE prices SET is_current = 0
-                            WHERE merkey = ? AND is_current = 1
-                        """, (merkey,))
-                        
-                        # Insert new price
-                        cursor.execute("""
-                            INSERT INTO prices (
-                                merkey, price_retail, effective_date, is_current
-                            ) VALUES (?, ?, date('now'), 1)
-                        """, (merkey, price))
+                        # Insert new price (the mark_old_prices_not_current
+                        # trigger retires the old one)
+                        new_prices_batch.append((merkey, price))
+                        pre_sync_prices.setdefault(merkey, old_price)
                         
                         changes['prices_updated'] += 1
                 else:
                     # No price record yet - add one
-                    cursor.execute("""
-                        INSERT INTO prices (
-                            merkey, price_retail, effective_date, is_current
-                        ) VALUES (?, ?, date('now'), 1)
-                    """, (merkey, price))
+                    new_prices_batch.append((merkey, price))
+                    pre_sync_prices.setdefault(merkey, None)
                     changes['prices_updated'] += 1
             
             # 3. Update/add barcodes
             if barcodes:
-                # Get existing barcodes
-                cursor.execute("""
-                    SELECT barcode FROM barcodes WHERE merkey = ?
-                """, (merkey,))
-                existing_barcodes = {row[0] for row in cursor.fetchall()}
-                
+                queued = set()
                 for idx, barcode in enumerate(barcodes):
-                    if barcode not in existing_barcodes:
+                    if (merkey, barcode) not in existing_barcode_pairs:
                         is_primary = 1 if idx == 0 else 0
-                        cursor.execute("""
-                            INSERT OR IGNORE INTO barcodes (
-                                merkey, barcode, is_primary
-                            ) VALUES (?, ?, ?)
-                        """, (merkey, barcode, is_primary))
+                        barcode_batch.append((merkey, barcode, is_primary))
                         
-                        if cursor.rowcount > 0:
+                        # A repeat within this record is ignored by the
+                        # UNIQUE(merkey, barcode) constraint: count it once
+                        if barcode not in queued:
+                            queued.add(barcode)
                             changes['barcodes_added'] += 1
-                            changes['barcode_changes'].append({
-                                'merkey': merkey,
-                                'barcode': barcode
-                            })
+                existing_barcode_pairs.update((merkey, barcode) for barcode in queued)
             
             changes['products_processed'] += 1
             
             if i % 1000 == 0:
-                conn.commit()
                 print(f"  Processed {i:,} / {len(records):,} products...", end='\r')
         
-        conn.commit()
+        flush()
+        
+        # Log the sync in the same transaction as its changes
+        cursor.execute("""
+            INSERT INTO sync_log (
+                sync_type, source_file, status, records_processed, records_updated,
+                records_added, started_at, completed_at
+            ) VALUES ('MP_MER_SYNC', ?, 'SUCCESS', ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (source_file, changes['products_processed'], changes['prices_updated'],
+              changes['new_products'], started_at))
+        cursor.execute("COMMIT")
         print()
         print(f"  ✓ Processed {changes['products_processed']:,} products")
         print()
         
-        # Update sync log
-        cursor.execute("""
-            UPDATE sync_log SET
-                status = 'SUCCESS',
-                records_processed = ?,
-                records_updated = ?,
-                records_added = ?,
-                completed_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (changes['products_processed'], changes['prices_updated'], 
-              len(changes['new_products']), sync_id))
-        
-        conn.commit()
+        # Finish the change log: append the spooled sections
+        log_f.write("\n")
+        log_f.write("PRICE CHANGES\n")
+        log_f.write("-" * 80 + "\n")
+        price_log.seek(0)
+        shutil.copyfileobj(price_log, log_f)
+        log_f.write("\n")
+        
+        log_f.write("MEDESC CHANGES (REVIEW REQUIRED)\n")
+        log_f.write("-" * 80 + "\n")
+        medesc_log.seek(0)
+        shutil.copyfileobj(medesc_log, log_f)
+        
+        change_logs.pop_all()  # keep the log file
+        log_f.close()
+        price_log.close()
+        medesc_log.close()
         
         # Print detailed change report
         print("=" * 80)
@@ -391,12 +588,12 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
         
         # New products
         if changes['new_products']:
-            print(f"🆕 NEW PRODUCTS: {len(changes['new_products']):,}")
+            print(f"🆕 NEW PRODUCTS: {changes['new_products']:,}")
             print()
-            for prod in changes['new_products'][:20]:  # Show first 20
+            for prod in new_product_samples:  # Show first 20
                 print(f"  + {prod['merkey']:10s} {prod['medesc'][:60]:60s} ₱{prod['price']:>8.2f}")
-            if len(changes['new_products']) > 20:
-                print(f"  ... and {len(changes['new_products']) - 20} more")
+            if changes['new_products'] > REPORT_SAMPLE_SIZE:
+                print(f"  ... and {changes['new_products'] - REPORT_SAMPLE_SIZE} more")
             print()
         else:
             print("✓ No new products")
@@ -404,17 +601,15 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
         
         # Price changes
         if changes['price_changes']:
-            print(f"💰 PRICE CHANGES: {len(changes['price_changes']):,}")
+            print(f"💰 PRICE CHANGES: {changes['price_changes']:,}")
             print()
-            for change in sorted(changes['price_changes'], 
-                                key=lambda x: abs(x['pct_change']), 
-                                reverse=True)[:20]:
+            for _, _, change in sorted(largest_price_changes, reverse=True):
                 direction = "↑" if change['diff'] > 0 else "↓"
                 print(f"  {direction} {change['merkey']:10s} {change['medesc'][:50]:50s}")
                 print(f"     ₱{change['old_price']:>8.2f} → ₱{change['new_price']:>8.2f} "
                       f"({change['pct_change']:>+6.1f}%)")
-            if len(changes['price_changes']) > 20:
-                print(f"  ... and {len(changes['price_changes']) - 20} more")
+            if changes['price_changes'] > REPORT_SAMPLE_SIZE:
+                print(f"  ... and {changes['price_changes'] - REPORT_SAMPLE_SIZE} more")
             print()
         else:
             print("✓ No price changes")
@@ -422,61 +617,29 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
         
         # MEDESC changes (IMPORTANT!)
         if changes['medesc_changes']:
-            print(f"⚠️  MEDESC CHANGES: {len(changes['medesc_changes']):,}")
+            print(f"⚠️  MEDESC CHANGES: {changes['medesc_changes']:,}")
             print("    (Possible size/property changes - REVIEW REQUIRED)")
             print()
-            for change in changes['medesc_changes'][:20]:
+            for change in medesc_change_samples:
                 print(f"  ! {change['merkey']:10s}")
                 print(f"     OLD: {change['old_medesc']}")
                 print(f"     NEW: {change['new_medesc']}")
                 print()
-            if len(changes['medesc_changes']) > 20:
-                print(f"  ... and {len(changes['medesc_changes']) - 20} more")
+            if changes['medesc_changes'] > REPORT_SAMPLE_SIZE:
+                print(f"  ... and {changes['medesc_changes'] - REPORT_SAMPLE_SIZE} more")
             print()
         else:
             print("✓ No MEDESC changes")
             print()
         
         # Barcode changes
-        if changes['barcode_changes']:
-            print(f"📊 NEW BARCODES: {len(changes['barcode_changes']):,}")
+        if changes['barcodes_added']:
+            print(f"📊 NEW BARCODES: {changes['barcodes_added']:,}")
         else:
             print("✓ No new barcodes")
         
         print()
         
-        # Save detailed change log
-        log_file = f"sync_changes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        with open(log_file, 'w', encoding='utf-8') as f:
-            f.write("=" * 80 + "\n")
-            f.write("MP_MER SYNC - DETAILED CHANGE LOG\n")
-            f.write("=" * 80 + "\n")
-            f.write(f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Source: {mp_mer_path}\n")
-            f.write("\n")
-            
-            f.write("NEW PRODUCTS\n")
-            f.write("-" * 80 + "\n")
-            for prod in changes['new_products']:
-                f.write(f"{prod['merkey']}\t{prod['medesc']}\t₱{prod['price']:.2f}\n")
-            f.write("\n")
-            
-            f.write("PRICE CHANGES\n")
-            f.write("-" * 80 + "\n")
-            for change in changes['price_changes']:
-                f.write(f"{change['merkey']}\t{change['medesc']}\t"
-                       f"₱{change['old_price']:.2f} → ₱{change['new_price']:.2f}\t"
-                       f"{change['pct_change']:+.1f}%\n")
-            f.write("\n")
-            
-            f.write("MEDESC CHANGES (REVIEW REQUIRED)\n")
-            f.write("-" * 80 + "\n")
-            for change in changes['medesc_changes']:
-                f.write(f"{change['merkey']}\n")
-                f.write(f"  OLD: {change['old_medesc']}\n")
-                f.write(f"  NEW: {change['new_medesc']}\n")
-                f.write("\n")
-        
         print(f"✓ Detailed log saved: {log_file}")
         print()
         
@@ -495,14 +658,15 @@ def sync_mp_mer(db_path='anson_products.db', mp_mer_path=None, mp_mer2_path=None
         import traceback
         traceback.print_exc()
         
+        # Nothing from a failed run is kept, only its sync_log entry
+        change_logs.close()
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
         cursor.execute("""
-            UPDATE sync_log SET
-                status = 'FAILED',
-                error_message = ?,
-                completed_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (str(e), sync_id))
-        conn.commit()
+            INSERT INTO sync_log (
+                sync_type, source_file, status, error_message, started_at, completed_at
+            ) VALUES ('MP_MER_SYNC', ?, 'FAILED', ?, ?, CURRENT_TIMESTAMP)
+        """, (source_file, str(e), started_at))
         conn.close()
         
         return False
@@ -7,26 +7,52 @@ Usage:
     python update_prices_for_awesome_table.py
 """
 
+import gzip
+import mmap
 import struct
+import sys
 import csv
+from concurrent.futures import ThreadPoolExecutor
+from itertools import compress
+from operator import itemgetter
 from pathlib import Path
 from datetime import datetime
+from functools import lru_cache
 
+# DBF header: record count, header length and record length after the
+# 4 bytes of version and last-update date
+_DBF_HEADER = struct.Struct('<4xIHH')
 
-def read_dbf_file(filepath):
-    """Read FoxPro DBF file and return records"""
+# Maps a record's deletion-flag byte to 0 (deleted, '*') or 1 (live)
+_LIVE_FLAG_TABLE = bytes(0 if b == 0x2A else 1 for b in range(256))
+
+# Columns of the merged product master, MERKEY first: the MP_MER fields the
+# merge and export read (the rest of each record is never decoded)
+MASTER_COLUMNS = ('MERKEY', 'MEDESC', 'MERETP', 'MEAN13', 'BARCD1', 'MEBRAC', 'USRDAT')
+BRAND_INDEX = MASTER_COLUMNS.index('MEBRAC')
+USRDAT_INDEX = MASTER_COLUMNS.index('USRDAT')
+
+
+def iter_dbf_records(filepath, needed_fields=None, columns=None):
+    """
+    Read FoxPro DBF file, yielding one record dict at a time
+    
+    needed_fields: names of the fields to decode (all, if None); the others
+    are skipped as padding and left out of the record dicts
+    columns: if given, only these fields are decoded and each record is a
+    list of their values in this order ('' for a field the file lacks)
+    """
+    if columns is not None:
+        needed_fields = frozenset(columns)
     
     with open(filepath, 'rb') as f:
         # Read header
         header = f.read(32)
-        num_records = struct.unpack('<I', header[4:8])[0]
-        header_length = struct.unpack('<H', header[8:10])[0]
-        record_length = struct.unpack('<H', header[10:12])[0]
+        num_records, header_length, record_length = _DBF_HEADER.unpack_from(header)
         
         # Read field descriptors
         f.seek(32)
         fields = []
-        field_positions = {}
         current_pos = 1
         
         while True:
@@ -38,50 +64,97 @@ def read_dbf_file(filepath):
             field_type = chr(field_desc[11])
             field_length = field_desc[16]
             
-            field_positions[field_name] = (current_pos, field_length, field_type)
             fields.append({'name': field_name, 'type': field_type, 'length': field_length})
             current_pos += field_length
         
-        # Read all records
-        f.seek(header_length)
-        records = []
+        # Every record is split in one C call: a struct layout of each
+        # needed field in file order ('x' padding over the deletion flag and
+        # the rest)
+        for field in fields:
+            field['wanted'] = needed_fields is None or field['name'] in needed_fields
+        record_struct = struct.Struct('<x' + ''.join(
+            f"{field['length']}{'s' if field['wanted'] else 'x'}" for field in fields)
+            + f'{max(record_length - current_pos, 0)}x')
+        if record_struct.size != record_length:
+            raise ValueError(f"Field lengths do not match record length in {filepath}")
         
-        for i in range(num_records):
-            record_data = f.read(record_length)
-            
-            if not record_data or len(record_data) < record_length:
-                break
+        # Numeric and date fields decode as ASCII (dropping any other bytes),
+        # everything else as latin-1, which maps every byte and so never needs
+        # an error handler. Encoding and errors are passed positionally: no
+        # keyword parsing on each decode call.
+        decoders = tuple((field['name'], 'ascii', 'ignore') if field['type'] in ('N', 'D')
+                         else (field['name'], 'latin-1', 'strict')
+                         for field in fields if field['wanted'])
+        
+        # Each record is built by a function generated for this file: one
+        # straight-line dict (or, with columns, list) display instead of a
+        # loop over the decoders for every record
+        expressions = {name: f"values[{j}].decode({encoding!r}, {errors!r}).strip()"
+                       for j, (name, encoding, errors) in enumerate(decoders)}
+        if columns is None:
+            display = '{' + ', '.join(f'{name!r}: {expression}' for name, expression in expressions.items()) + '}'
+        else:
+            display = '[' + ', '.join(expressions.get(name, "''") for name in columns) + ']'
+        namespace = {}
+        exec(f'def make_record(values):\n    return {display}\n', namespace)
+        make_record = namespace['make_record']
+        
+        # Map the file and unpack each record in place: a sweep of record
+        # offsets over the mapped region, with the OS page cache doing the I/O
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            available = max(0, len(mm) - header_length) // record_length
+            end = header_length + min(num_records, available) * record_length  # truncated file -> stop
             
-            if record_data[0] == 0x2A:  # Deleted record
-                continue
+            # Deleted records are dropped up front: the deletion flags come out
+            # in one strided slice and filter the offsets with translate/compress,
+            # so there is no per-record Python branch on the flag byte
+            live = mm[header_length:end:record_length].translate(_LIVE_FLAG_TABLE)
+            unpack_from = record_struct.unpack_from
+            show_progress = sys.stdout.isatty()  # no progress lines in redirected output
+            read = 0
             
-            record = {}
-            for field_name, (pos, length, ftype) in field_positions.items():
-                field_data = record_data[pos:pos + length]
+            for i, offset in compress(enumerate(range(header_length, end, record_length), 1), live):
+                yield make_record(unpack_from(mm, offset))
+                read += 1
                 
-                if ftype == 'C':
-                    value = field_data.decode('latin-1', errors='ignore').strip()
-                elif ftype == 'N':
-                    value = field_data.decode('ascii', errors='ignore').strip()
-                elif ftype == 'D':
-                    value = field_data.decode('ascii', errors='ignore').strip()
-                else:
-                    value = field_data.decode('latin-1', errors='ignore').strip()
-                
-                record[field_name] = value
-            
-            records.append(record)
-            
-            if (i + 1) % 5000 == 0:
-                print(f"  Read {i + 1:,} / {num_records:,} records...", end='\r')
-        
-        print(f"  Read {len(records):,} records (total in file: {num_records:,})")
+                if show_progress and i % 5000 == 0:
+                    print(f"  Read {i:,} / {num_records:,} records...", end='\r')
         
-    return records
+        print(f"  Read {read:,} records (total in file: {num_records:,})")
+
+
+@lru_cache(maxsize=8192)
+def parse_price(price):
+    """
+    MERETP text -> float (0.0 if blank or not a number). Cached: a catalog
+    has far fewer distinct price strings than products, so each string is
+    parsed (and a bad one raises) only once.
+    """
+    try:
+        return float(price) if price else 0.0
+    except ValueError:
+        return 0.0
+
+
+def prefetch_file(filepath, chunk_size=1 << 20):
+    """
+    Read a file once and discard the bytes, so its pages are already in the
+    OS page cache when it is mapped. Meant for a worker thread: the reads
+    release the GIL.
+    """
+    buffer = bytearray(chunk_size)
+    with open(filepath, 'rb', buffering=0) as f:
+        while f.readinto(buffer):
+            pass
 
 
 def merge_product_databases(mp_mer_path, mp_mer2_path=None):
-    """Merge MP_MER.FPB and MP_MER2.FPB files"""
+    """
+    Merge MP_MER.FPB and MP_MER2.FPB files
+    
+    Returns the product master column-wise: {field: [value per product]} for
+    each of MASTER_COLUMNS, one row per MERKEY
+    """
     
     print("=" * 80)
     print("READING PRODUCT MASTER FILES")
@@ -89,53 +162,73 @@ def merge_product_databases(mp_mer_path, mp_mer2_path=None):
     print()
     
     print(f"Reading: {mp_mer_path}")
-    records1 = read_dbf_file(mp_mer_path)
     
-    # Create dictionary keyed by MERKEY
-    product_master = {}
-    for record in records1:
-        merkey = record.get('MERKEY', '').strip()
-        if merkey:
-            product_master[merkey] = record
+    # The master is kept as one list per field plus a MERKEY -> row index.
+    # Records are read as value lists in MASTER_COLUMNS order (already
+    # stripped) and merged into it as they come, so there is no per-product
+    # dict at all.
+    product_master = {name: [] for name in MASTER_COLUMNS}
+    columns = tuple(product_master.values())
+    usrdat_column = product_master['USRDAT']
+    rows = {}
+    
+    def store(values, row):
+        """Write a record's values into the columns at row (a new row if None)"""
+        # Few brand codes repeat across thousands of products: one str each
+        values[BRAND_INDEX] = sys.intern(values[BRAND_INDEX])
+        if row is None:
+            rows[values[0]] = len(rows)
+            for column, value in zip(columns, values):
+                column.append(value)
+        else:
+            for column, value in zip(columns, values):
+                column[row] = value
+    
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Pull MP_MER2 off disk while MP_MER is decoded (a missing file is
+        # reported when it is read below)
+        if mp_mer2_path:
+            executor.submit(prefetch_file, mp_mer2_path)
+        
+        for values in iter_dbf_records(mp_mer_path, columns=MASTER_COLUMNS):
+            merkey = values[0]
+            if merkey:
+                store(values, rows.get(merkey))
     
-    print(f"✓ Loaded {len(product_master):,} products from MP_MER.FPB")
+    print(f"✓ Loaded {len(rows):,} products from MP_MER.FPB")
     
     # Merge with MP_MER2 if provided
     if mp_mer2_path:
         print()
         print(f"Reading: {mp_mer2_path}")
-        records2 = read_dbf_file(mp_mer2_path)
         
         merged_count = 0
         new_count = 0
         
-        for record in records2:
-            merkey = record.get('MERKEY', '').strip()
+        for values in iter_dbf_records(mp_mer2_path, columns=MASTER_COLUMNS):
+            merkey = values[0]
             if merkey:
-                if merkey in product_master:
-                    # Update existing - use newer USRDAT if available
-                    existing_date = product_master[merkey].get('USRDAT', '')
-                    new_date = record.get('USRDAT', '')
-                    
-                    if new_date >= existing_date:
-                        product_master[merkey] = record
-                        merged_count += 1
-                else:
-                    product_master[merkey] = record
+                row = rows.get(merkey)
+                if row is None:
+                    store(values, None)
                     new_count += 1
+                # Update existing - use newer USRDAT if available
+                elif values[USRDAT_INDEX] >= usrdat_column[row]:
+                    store(values, row)
+                    merged_count += 1
         
         print(f"✓ Updated {merged_count:,} existing products")
         print(f"✓ Added {new_count:,} new products from MP_MER2.FPB")
     
     print()
-    print(f"TOTAL PRODUCTS IN MASTER: {len(product_master):,}")
+    print(f"TOTAL PRODUCTS IN MASTER: {len(rows):,}")
     print()
     
     return product_master
 
 
 def export_to_awesome_table_format(product_master, output_csv, image_base_url):
-    """Export products in Awesome Table format"""
+    """Export products (columns from merge_product_databases) in Awesome Table format"""
     
     print("=" * 80)
     print("EXPORTING TO AWESOME TABLE FORMAT")
@@ -145,7 +238,15 @@ def export_to_awesome_table_format(product_master, output_csv, image_base_url):
     exported_count = 0
     skipped_count = 0
     
-    with open(output_csv, 'w', newline='', encoding='utf-8') as f:
+    # An output name ending in .gz is written gzip-compressed (level 1, so
+    # compression stays cheap next to the disk writes it saves)
+    if str(output_csv).endswith('.gz'):
+        output = gzip.open(output_csv, 'wt', compresslevel=1, encoding='utf-8', newline='')
+    else:
+        # 1 MiB write buffer: the rows reach the file in large blocks
+        output = open(output_csv, 'w', newline='', encoding='utf-8', buffering=1 << 20)
+    
+    with output as f:
         fieldnames = [
             'Brand', 'Name', 'Description', 'Size', 
             'SRP_MODE1', 'SRP_MODE2', 'SRP_MODE3',
@@ -153,67 +254,78 @@ def export_to_awesome_table_format(product_master, output_csv, image_base_url):
             'MERKEY', 'MEDESC', 'PRICE2', 'Barcode'
         ]
         
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+        # Rows are tuples in fieldnames order (no per-row dict for a
+        # DictWriter to look the fields up in)
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
         
-        for merkey, record in sorted(product_master.items()):
-            # Get price
-            price = record.get('MERETP', '0').strip()
-            try:
-                price_float = float(price) if price else 0.0
-            except ValueError:
-                price_float = 0.0
-            
-            # Skip if no valid price
-            if price_float <= 0:
-                skipped_count += 1
-                continue
-            
-            # Get description
-            description = record.get('MEDESC', '').strip()
-            if not description:
-                skipped_count += 1
-                continue
-            
-            # Get barcode
-            barcode = record.get('MEAN13', '').strip()
-            if not barcode:
-                barcode = record.get('BARCD1', '').strip()
-            
-            # Format barcode with asterisks
-            if barcode:
-                barcode_formatted = f"*{barcode}*"
-            else:
-                barcode_formatted = ""
-            
-            # Build photo URL
-            # Create filename from description (simplified)
-            photo_filename = description.replace(' ', '-') + '.jpg'
-            photo_url = f"{image_base_url}{photo_filename}"
-            
-            # Export row
-            row = {
-                'Brand': record.get('MEBRAC', '').strip(),  # Brand code, might need mapping
-                'Name': description.split()[0] if description else '',  # First word as name
-                'Description': description,
-                'Size': '',  # Extract from description if needed
-                'SRP_MODE1': price_float,  # Case price (same for now)
-                'SRP_MODE2': price_float,  # Pack price (same for now)
-                'SRP_MODE3': price_float,  # Per piece price
-                'Photo': photo_url,
-                'Cards': photo_filename,
-                'Search': '',
-                'MERKEY': merkey,
-                'MEDESC': description,
-                'PRICE2': price_float,
-                'Barcode': barcode_formatted
-            }
-            
-            writer.writerow(row)
-            exported_count += 1
-            
-            if exported_count % 1000 == 0:
-                print(f"  Exported {exported_count:,} products...", end='\r')
+        def export_rows():
+            """
+            Yield the output row for every exportable product, in
+            product_master row order. Fed into writerows, so the csv module
+            drives the loop and there is no writerow call per product.
+            """
+            nonlocal exported_count, skipped_count
+            show_progress = sys.stdout.isatty()  # no progress lines in redirected output
+                
+            # Field values are stripped once by the reader, so none of them
+            # is stripped again here. Products are read row by row across
+            # the columns.
+            for merkey, description, price, mean13, barcd1, brand in zip(
+                    *(product_master[name] for name in ('MERKEY', 'MEDESC', 'MERETP', 'MEAN13', 'BARCD1', 'MEBRAC'))):
+                # Get price
+                price_float = parse_price(price)
+                
+                # Skip if no valid price
+                if price_float <= 0:
+                    skipped_count += 1
+                    continue
+                
+                # Check description
+                if not description:
+                    skipped_count += 1
+                    continue
+                
+                # Get barcode (EAN-13, else BARCD1), formatted with asterisks
+                barcode = mean13 or barcd1
+                barcode_formatted = f"*{barcode}*" if barcode else ""
+                
+                # Build photo URL
+                # Create filename from description (simplified)
+                photo_filename = description.replace(' ', '-') + '.jpg'
+                photo_url = image_base_url + photo_filename
+                
+                # First word as name: description is non-empty here, so split
+                # off just the first word instead of splitting the whole text
+                name = description.split(None, 1)[0]
+                
+                # Export row
+                row = (
+                    brand,  # Brand: brand code, might need mapping
+                    name,  # Name: first word
+                    description,  # Description
+                    '',  # Size: extract from description if needed
+                    price_float,  # SRP_MODE1: case price (same for now)
+                    price_float,  # SRP_MODE2: pack price (same for now)
+                    price_float,  # SRP_MODE3: per piece price
+                    photo_url,  # Photo
+                    photo_filename,  # Cards
+                    '',  # Search
+                    merkey,  # MERKEY
+                    description,  # MEDESC
+                    price_float,  # PRICE2
+                    barcode_formatted  # Barcode
+                )
+                
+                yield row
+                exported_count += 1
+                
+                if show_progress and exported_count % 1000 == 0:
+                    print(f"  Exported {exported_count:,} products...", end='\r')
+        
+        # Only the exported rows are sorted by MERKEY (column 10); skipped
+        # products never enter the sort
+        writer.writerows(sorted(export_rows(), key=itemgetter(10)))
     
     print()
     print(f"✓ Exported {exported_count:,} products to {output_csv}")
@@ -234,7 +346,7 @@ def main():
     # Configuration - UPDATE THESE PATHS
     MP_MER_PATH = "MP_MER.FPB"  # Path to your latest MP_MER.FPB
     MP_MER2_PATH = "MP_MER2.FPB"  # Path to MP_MER2.FPB (or None if not using)
-    OUTPUT_CSV = "AWESOME_TABLE_PRODUCTS_UPDATED.csv"
+    OUTPUT_CSV = "AWESOME_TABLE_PRODUCTS_UPDATED.csv"  # End with .csv.gz for a gzip-compressed export
     IMAGE_BASE_URL = "https://s3-ap-southeast-1.amazonaws.com/ansonsupermart.com/images/"
     
     print("Configuration:")
@@ -261,7 +373,7 @@ def main():
     print("COMPLETE!")
     print("=" * 80)
     print()
-    print(f"✓ Product master updated with {len(product_master):,} products")
+    print(f"✓ Product master updated with {len(product_master['MERKEY']):,} products")
     print(f"✓ Exported {exported:,} products to Awesome Table format")
     print(f"✓ Output file: {OUTPUT_CSV}")
     print()